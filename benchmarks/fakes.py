@@ -0,0 +1,175 @@
+import asyncio
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+import pandas as pd
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from benchmarks.fixtures import Fixtures
+
+# Constants
+DEFAULT_LLM_LATENCY = 0.3
+DEFAULT_TOKENS_PER_SECOND = 250
+DEFAULT_ANSWER_TOKENS = 120
+DEFAULT_YAHOO_LATENCY = 0.08
+
+_QUESTION_PATTERN = re.compile(r"- Question: (.*)")
+
+
+def _question(messages: List[BaseMessage]) -> str:
+    content = str(messages[-1].content)
+    match = _QUESTION_PATTERN.search(content)
+    return match.group(1) if match else content
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Offline stand-in for the Groq models. Answers after `latency` seconds and streams at
+    `tokens_per_second`: tool calls when tools are bound, a JSON list of capitalized words
+    for the extraction prompt, filler text otherwise.
+    """
+
+    latency: float = DEFAULT_LLM_LATENCY
+    tokens_per_second: float = DEFAULT_TOKENS_PER_SECOND
+    answer_tokens: int = DEFAULT_ANSWER_TOKENS
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _respond(self, messages: List[BaseMessage], kwargs) -> AIMessage:
+        question = _question(messages)
+        if kwargs.get("tools"):
+            tool_calls = [
+                {"name": name, "args": {"question": question}, "id": f"stub_{uuid.uuid4().hex[:12]}", "type": "tool_call"}
+                for name in ("get_stock_trading_info", "get_performance_stats")
+            ]
+            return AIMessage(content="", tool_calls=tool_calls)
+        if "Extract companies" in str(messages[-1].content):
+            return AIMessage(content=json.dumps(re.findall(r"\b[A-Z][a-z]{2,}\b", question)))
+        return AIMessage(content=" ".join(["lorem"] * self.answer_tokens))
+
+    def _delay(self, message: AIMessage) -> float:
+        return self.latency + len(str(message.content).split()) / self.tokens_per_second
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        message = self._respond(messages, kwargs)
+        time.sleep(self._delay(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        message = self._respond(messages, kwargs)
+        await asyncio.sleep(self._delay(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        for token in str(self._respond(messages, kwargs).content).split(" "):
+            time.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token + " "))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        for token in str(self._respond(messages, kwargs).content).split(" "):
+            await asyncio.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token + " "))
+
+
+class FakeTicker:
+    fixtures: Fixtures = None
+    latency = DEFAULT_YAHOO_LATENCY
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+
+    @property
+    def info(self) -> dict:
+        time.sleep(self.latency)
+        return dict(self.fixtures.info(self.symbol))
+
+
+def fake_download(tickers, period=None, start=None, **kwargs) -> pd.DataFrame:
+    time.sleep(FakeTicker.latency)
+    symbols = [tickers] if isinstance(tickers, str) else list(tickers)
+    frames = dict()
+    for symbol in symbols:
+        frame = FakeTicker.fixtures.history(symbol)
+        frames[symbol] = frame[frame.index >= pd.Timestamp(start)] if start is not None else frame
+    return pd.concat(frames, axis=1)
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self._data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._data
+
+
+class FakeSearchSession:
+    def __init__(self, fixtures: Fixtures, latency=DEFAULT_YAHOO_LATENCY):
+        self.fixtures = fixtures
+        self.latency = latency
+
+    def get(self, url, params=None, timeout=None):
+        time.sleep(self.latency)
+        return FakeResponse(self.fixtures.search(params["q"]))
+
+
+def reset_caches(directory: Optional[str] = None):
+    """
+    Empties every cache of the pipeline: market data tiers, history store, ticker resolution
+    and answers. New cache files go to a fresh directory under `directory`.
+    """
+    from chatbot import services
+    from chatbot.answer_cache import ANSWER_CACHE
+    from chatbot.cache import MemoryCache, SQLiteCache, TieredCache
+    from chatbot.data import YahooFinData
+    from chatbot.timeseries import PriceHistoryStore
+
+    directory = tempfile.mkdtemp(prefix="cache-", dir=directory)
+    YahooFinData.cache = TieredCache(MemoryCache(), SQLiteCache(os.path.join(directory, "market_data.sqlite")))
+    YahooFinData.history_store = PriceHistoryStore(os.path.join(directory, "history"))
+    services._get_ticker_from_name.cache_clear()
+    with services._EXTRACTED_COMPANIES_LOCK:
+        services._EXTRACTED_COMPANIES.clear()
+    ANSWER_CACHE.clear()
+
+
+def install(fixtures: Fixtures, yahoo_latency=DEFAULT_YAHOO_LATENCY, llm_latency=DEFAULT_LLM_LATENCY,
+            tokens_per_second=DEFAULT_TOKENS_PER_SECOND, cache_directory=None):
+    """
+    Replaces Yahoo Finance, Yahoo search and the LLM clients with offline fakes.
+
+    The stub models sit behind the real gateway, without rate limits, so the measured time
+    includes the gateway but not the provider quotas.
+    """
+    import yfinance
+
+    from chatbot import llm, services
+    from chatbot.gateway import GatewayChatModel
+
+    FakeTicker.fixtures = fixtures
+    FakeTicker.latency = yahoo_latency
+    yfinance.Ticker = FakeTicker
+    yfinance.download = fake_download
+    services._SEARCH_SESSION = FakeSearchSession(fixtures, yahoo_latency)
+
+    for name in llm._MODEL_FACTORIES:
+        llm._MODELS[name] = GatewayChatModel(model=StubChatModel(latency=llm_latency, tokens_per_second=tokens_per_second))
+
+    reset_caches(cache_directory)
@@ -0,0 +1,134 @@
+import json
+import os
+import zlib
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from chatbot.fields import COMPANY_INFO_FIELDS, FINANCIAL_INFO_FIELDS, TRADING_INFO_FIELDS
+
+# Constants
+FIXTURES_DIR = os.environ.get("BENCHMARK_FIXTURES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures"))
+SYNTHETIC_HISTORY_YEARS = 20
+TEXT_INFO_KEYS = {
+    "symbol", "exchange", "address1", "city", "state", "zip", "country", "phone", "website", "industry", "sector",
+    "longBusinessSummary", "longName", "shortName", "currency", "financialCurrency", "recommendationKey",
+    "regularMarketDayRange",
+}
+
+
+def _rng(symbol) -> np.random.Generator:
+    # Seeded by the symbol, so every run and every process sees the same synthetic data
+    return np.random.default_rng(zlib.crc32(symbol.encode()))
+
+
+def synthetic_info(symbol) -> dict:
+    """
+    An info dict with every key the tools read, numbers drawn per symbol.
+    """
+    rng = _rng(symbol)
+    info = dict()
+    for schema in (COMPANY_INFO_FIELDS, TRADING_INFO_FIELDS, FINANCIAL_INFO_FIELDS):
+        for key, _ in schema.values():
+            if key in TEXT_INFO_KEYS:
+                info[key] = f"{symbol} {key}"
+            else:
+                info[key] = float(rng.lognormal(3, 1))
+    info["symbol"] = symbol
+    info["longBusinessSummary"] = " ".join([f"{symbol} builds and sells products."] * 40)
+    info["fullTimeEmployees"] = int(rng.integers(1_000, 200_000))
+    info["companyOfficers"] = [
+        {"name": f"Officer {i}", "title": "Executive", "age": 50 + i, "totalPay": 1_000_000 * i} for i in range(10)
+    ]
+    return info
+
+
+def synthetic_history(symbol, years=SYNTHETIC_HISTORY_YEARS) -> pd.DataFrame:
+    """
+    Daily OHLCV bars following a geometric random walk, indexed like `yf.download` output.
+    """
+    rng = _rng(symbol)
+    dates = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=years * 252, name="Date")
+    close = 50 * np.exp(np.cumsum(rng.normal(0.0003, 0.018, len(dates))))
+    spread = np.abs(rng.normal(0, 0.01, len(dates)))
+    return pd.DataFrame({
+        "Open": close * (1 + rng.normal(0, 0.005, len(dates))),
+        "High": close * (1 + spread),
+        "Low": close * (1 - spread),
+        "Close": close,
+        "Volume": rng.integers(1_000_000, 50_000_000, len(dates)).astype(float),
+    }, index=dates)
+
+
+def synthetic_search(name) -> dict:
+    symbol = "".join(ch for ch in name.upper() if ch.isalpha())[:4] or "NONE"
+    return {"quotes": [{"symbol": symbol, "shortname": name, "longname": name, "exchange": "NMS"}]}
+
+
+class Fixtures:
+    """
+    Market data replayed by the benchmark fakes: recorded responses when `record.py` saved
+    them in `directory`, synthetic data otherwise.
+    """
+
+    def __init__(self, directory=FIXTURES_DIR):
+        self.directory = directory
+        self._info = dict()
+        self._history = dict()
+        self._search = self._load_json(os.path.join(directory, "search.json")) or dict()
+
+    @staticmethod
+    def _load_json(path) -> Optional[dict]:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def info(self, symbol) -> dict:
+        if symbol not in self._info:
+            recorded = self._load_json(os.path.join(self.directory, "info", f"{symbol}.json"))
+            self._info[symbol] = recorded if recorded is not None else synthetic_info(symbol)
+        return self._info[symbol]
+
+    def history(self, symbol) -> pd.DataFrame:
+        if symbol not in self._history:
+            path = os.path.join(self.directory, "history", f"{symbol}.pkl")
+            self._history[symbol] = pd.read_pickle(path) if os.path.exists(path) else synthetic_history(symbol)
+        return self._history[symbol]
+
+    def search(self, name) -> dict:
+        return self._search.get(name) or synthetic_search(name)
+
+    def is_recorded(self) -> bool:
+        return os.path.isdir(os.path.join(self.directory, "info"))
+
+
+def benchmark_symbols(count) -> List[str]:
+    """
+    The first `count` symbols of the symbol list, so questions resolve through the local index.
+    """
+    from chatbot.symbols import SYMBOL_LIST_PATH
+
+    symbols = pd.read_csv(SYMBOL_LIST_PATH, usecols=["symbol"])["symbol"]
+    symbols = [symbol for symbol in dict.fromkeys(symbols) if symbol.isalpha()]
+    if count > len(symbols):
+        raise ValueError(f"Only {len(symbols)} symbols in {SYMBOL_LIST_PATH}, asked for {count}")
+    return symbols[:count]
+
+
+def save_fixture(directory, kind, symbol, data):
+    path = os.path.join(directory, kind)
+    os.makedirs(path, exist_ok=True)
+    if kind == "history":
+        data.to_pickle(os.path.join(path, f"{symbol}.pkl"))
+    else:
+        with open(os.path.join(path, f"{symbol}.json"), "w") as f:
+            json.dump(data, f, default=str)
+
+
+def save_search_fixtures(directory, responses: Dict[str, dict]):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "search.json"), "w") as f:
+        json.dump(responses, f)
@@ -0,0 +1,41 @@
+import argparse
+
+import requests
+import yfinance as yf
+
+from benchmarks.fixtures import FIXTURES_DIR, benchmark_symbols, save_fixture, save_search_fixtures
+from chatbot.services import YAHOO_FIN_SEARCH_BASE, YAHOO_FIN_SEARCH_TIMEOUT, _SEARCH_SESSION
+
+# Usage: python -m benchmarks.record [--count 50] [--names "Apple" "Microsoft"]
+# Needs network access, the benchmarks themselves then run offline from the saved files
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record Yahoo responses for the benchmarks")
+    parser.add_argument("--count", type=int, default=50, help="Number of symbols from the symbol list to record")
+    parser.add_argument("--names", nargs="*", default=["Apple", "Microsoft", "Nvidia", "Berkshire Hathaway"])
+    parser.add_argument("--directory", default=FIXTURES_DIR)
+    args = parser.parse_args()
+
+    symbols = benchmark_symbols(args.count)
+    for symbol in symbols:
+        save_fixture(args.directory, "info", symbol, yf.Ticker(symbol).info)
+        print(f"Recorded info of {symbol}")
+
+    data = yf.download(symbols, period="max", group_by="ticker", auto_adjust=True, threads=True, progress=False)
+    for symbol in symbols:
+        frame = data[symbol].dropna(how="all")
+        if frame.index.tz is not None:
+            frame = frame.tz_localize(None)
+        frame.index.name = "Date"
+        save_fixture(args.directory, "history", symbol, frame)
+        print(f"Recorded {len(frame)} bars of {symbol}")
+
+    responses = dict()
+    for name in args.names:
+        try:
+            response = _SEARCH_SESSION.get(YAHOO_FIN_SEARCH_BASE, params={"q": name}, timeout=YAHOO_FIN_SEARCH_TIMEOUT)
+            response.raise_for_status()
+            responses[name] = response.json()
+        except requests.exceptions.RequestException as ex:
+            print(f"Failed to record search of {name}: {ex}")
+    save_search_fixtures(args.directory, responses)
+    print(f"Recorded {len(responses)} searches")
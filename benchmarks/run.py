@@ -0,0 +1,214 @@
+import os
+import tempfile
+
+# The benchmark caches must never touch the real ones, set before chatbot is imported
+_WORK_DIR = tempfile.mkdtemp(prefix="quant-bench-")
+os.environ.setdefault("MARKET_DATA_CACHE_DIR", os.path.join(_WORK_DIR, "cache"))
+os.environ.setdefault("GROQ_API_KEY", "offline")
+os.environ.setdefault("GOOGLE_API_KEY", "offline")
+
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import platform
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from benchmarks import fakes
+from benchmarks.fixtures import Fixtures, benchmark_symbols
+from chatbot.answer_cache import ANSWER_CACHE
+from chatbot.charts import performance_snapshot, price_history_chart
+from chatbot.chat import AVAILABLE_TOOLS, ChatOutput, answer_question
+from chatbot.data import YahooFinData
+from chatbot.session import SessionContext
+from chatbot.stats import performance_stats, returns_matrix
+
+# Constants
+DEFAULT_TICKER_COUNTS = [1, 5, 50]
+DEFAULT_SESSIONS = [1, 10]
+DEFAULT_ITERATIONS = 10
+PERCENTILES = [50, 95, 99]
+
+BENCHMARKED_TOOLS = [name for name in AVAILABLE_TOOLS if name != "return_default_query"]
+
+
+def summarize(name, samples: List[float], wall: float, **params) -> dict:
+    """
+    Latency percentiles in seconds and throughput in completed calls per second.
+    """
+    result = {"scenario": name, **params, "samples": len(samples)}
+    if samples:
+        result.update({f"p{p}": float(np.percentile(samples, p)) for p in PERCENTILES})
+        result["mean"] = float(np.mean(samples))
+        result["throughput"] = len(samples) / wall if wall else None
+    return result
+
+
+def measure(func: Callable, iterations, cold, warmup=1) -> tuple:
+    samples = list()
+    wall = 0.0
+    for i in range(warmup + iterations):
+        if cold:
+            fakes.reset_caches(_WORK_DIR)
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        if i >= warmup:
+            samples.append(elapsed)
+            wall += elapsed
+    return samples, wall
+
+
+class TimingOutput(ChatOutput):
+    """
+    Discards the answer and records when its first and last token arrived.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token = None
+        self.last_token = None
+
+    async def token(self, chunk):
+        if self.first_token is None:
+            self.first_token = time.perf_counter() - self.started
+
+    async def close(self):
+        self.last_token = time.perf_counter() - self.started
+
+
+async def chat(question, session: Optional[SessionContext] = None) -> Dict[str, float]:
+    """
+    One `quant_chat` turn without the Chainlit UI, through the same `answer_question`.
+    """
+    output = TimingOutput()
+    await answer_question(question, session, output)
+    return {"first_token": output.first_token, "last_token": output.last_token}
+
+
+async def bench_chat(name, questions: List[str], sessions, iterations, cold, follow_up=None, keep_answers=False) -> List[dict]:
+    """
+    Runs `sessions` chat sessions concurrently. Each iteration starts new sessions and, unless
+    `keep_answers`, an empty answer cache; with `follow_up`, the sessions first ask their
+    question untimed and the follow-up is measured.
+    """
+    first_tokens, last_tokens = list(), list()
+    wall = 0.0
+    for i in range(1 + iterations):
+        if cold:
+            fakes.reset_caches(_WORK_DIR)
+        elif not keep_answers:
+            ANSWER_CACHE.clear()
+        contexts = [SessionContext() for _ in range(sessions)]
+        asked = [questions[s % len(questions)] for s in range(sessions)]
+        if follow_up is not None:
+            await asyncio.gather(*(answer_question(question, context) for question, context in zip(asked, contexts)))
+            asked = [follow_up] * sessions
+        started = time.perf_counter()
+        timings = await asyncio.gather(*(chat(question, context) for question, context in zip(asked, contexts)))
+        if i == 0:
+            continue  # warmup
+        wall += time.perf_counter() - started
+        first_tokens += [timing["first_token"] for timing in timings if timing["first_token"] is not None]
+        last_tokens += [timing["last_token"] for timing in timings if timing["last_token"] is not None]
+    return [
+        summarize(f"{name}:first_token", first_tokens, wall, sessions=sessions),
+        summarize(f"{name}:last_token", last_tokens, wall, sessions=sessions),
+    ]
+
+
+async def run(ticker_counts, session_counts, iterations, cold) -> List[dict]:
+    results = list()
+    for count in ticker_counts:
+        symbols = benchmark_symbols(count)
+        question = " ".join(symbols)
+        logging.info(f"Benchmarking {count} tickers")
+
+        for name in BENCHMARKED_TOOLS:
+            samples, wall = measure(lambda: AVAILABLE_TOOLS[name].invoke({"question": question}), iterations, cold)
+            results.append(summarize(f"tool:{name}", samples, wall, tickers=count))
+
+        # The kernels alone, on data that is already loaded
+        histories = YahooFinData.get_histories(symbols)
+        stock_returns = YahooFinData.get_returns(symbols)
+        paths = {
+            "stats": lambda: performance_stats(returns_matrix(stock_returns)),
+            "chart:price_history": lambda: [price_history_chart(frame, symbol) for symbol, frame in histories.items()],
+            "chart:performance_snapshot": lambda: [performance_snapshot(series, symbol) for symbol, series in stock_returns.items()],
+        }
+        for name, func in paths.items():
+            samples, wall = measure(func, iterations, cold=False)
+            results.append(summarize(name, samples, wall, tickers=count))
+
+        for sessions in session_counts:
+            results += [
+                {**result, "tickers": count}
+                for result in await bench_chat("chat:routed", [f"{question} price and sharpe ratio"], sessions, iterations, cold)
+            ]
+            results += [
+                {**result, "tickers": count}
+                for result in await bench_chat("chat:function_calling", [f"Should I buy {question}?"], sessions, iterations, cold)
+            ]
+            results += [
+                {**result, "tickers": count}
+                for result in await bench_chat(
+                    "chat:follow_up", [f"{question} price"], sessions, iterations, cold, follow_up="and their sharpe ratio?"
+                )
+            ]
+            results += [
+                {**result, "tickers": count}
+                for result in await bench_chat(
+                    "chat:cached", [f"{question} price and sharpe ratio"], sessions, iterations, cold=False, keep_answers=True
+                )
+            ]
+    return results
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Usage: python -m benchmarks.run [--tickers 1 5 50] [--sessions 1 10] [--output results.json]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline latency and throughput benchmarks")
+    parser.add_argument("--tickers", type=int, nargs="+", default=DEFAULT_TICKER_COUNTS)
+    parser.add_argument("--sessions", type=int, nargs="+", default=DEFAULT_SESSIONS, help="Concurrent chat sessions")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument("--cold", action="store_true", help="Empty every cache before each iteration")
+    parser.add_argument("--llm-latency", type=float, default=fakes.DEFAULT_LLM_LATENCY)
+    parser.add_argument("--tokens-per-second", type=float, default=fakes.DEFAULT_TOKENS_PER_SECOND)
+    parser.add_argument("--yahoo-latency", type=float, default=fakes.DEFAULT_YAHOO_LATENCY)
+    parser.add_argument("--output", help="Write the JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    fixtures = Fixtures()
+    fakes.install(fixtures, args.yahoo_latency, args.llm_latency, args.tokens_per_second, _WORK_DIR)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "revision": _git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "fixtures": "recorded" if fixtures.is_recorded() else "synthetic",
+            **{key: value for key, value in vars(args).items() if key != "output"},
+        },
+        # One event loop for the whole run, like the app
+        "results": asyncio.run(run(args.tickers, args.sessions, args.iterations, args.cold)),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
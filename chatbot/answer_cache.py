@@ -0,0 +1,117 @@
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Iterable, List, Optional
+
+from cachetools import TTLCache
+
+from chatbot.data import YahooFinData
+from chatbot.metrics import record_cache
+from chatbot.services import match_symbols_from_query
+
+# Constants
+ANSWER_TTL = 120
+ANSWER_CACHE_SIZE = 1024
+REPLAY_CHUNK_CHARS = 24
+
+# Words that do not change what is asked, "what is the AAPL price" and "AAPL price?" share an answer
+_FILLER_WORDS = {
+    "a", "an", "the", "please", "me", "show", "tell", "give", "what", "whats", "is", "are", "of", "for", "can", "you",
+    "could", "would", "current", "currently", "today", "now",
+}
+
+
+def normalize_question(question) -> str:
+    """
+    Normalizes a question for the answer cache key: lower-cased, without punctuation or filler words.
+    """
+    tokens = re.sub(r"[^\w^$.&-]+", " ", question.casefold().replace("'", "")).split()
+    tokens = [token.strip(".") for token in tokens]
+    return " ".join(token for token in tokens if token and token not in _FILLER_WORDS)
+
+
+class CachedAnswer:
+    def __init__(self, answer, figures, symbols, versions):
+        self.answer = answer
+        self.figures = figures
+        self.symbols = symbols
+        # Market data versions of `symbols` the answer was built on
+        self.versions = versions
+        self.created_at = time.time()
+
+    def is_current(self) -> bool:
+        return YahooFinData.data_version(self.symbols) == self.versions
+
+    def chunks(self, size=REPLAY_CHUNK_CHARS):
+        """
+        Splits the answer into chunks to replay it as a stream.
+        """
+        return [self.answer[i:i + size] for i in range(0, len(self.answer), size)]
+
+    def __repr__(self):
+        return f"CachedAnswer(symbols={self.symbols}, chars={len(self.answer)}, figures={len(self.figures)})"
+
+
+class AnswerCache:
+    """
+    Caches complete answers keyed on the normalized question and the symbols it mentions.
+
+    Each answer remembers every symbol its turn resolved, also those found by the extraction
+    LLM or Yahoo search, and the version of their market data. The version is read from the
+    shared market data cache, so fresh data loaded by any worker makes answers built on older
+    data stop matching; in the worker that loads it, they are also dropped right away through
+    the market data invalidation hook.
+    """
+
+    def __init__(self, ttl=ANSWER_TTL, maxsize=ANSWER_CACHE_SIZE):
+        self._lock = threading.Lock()
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._keys_by_symbol = defaultdict(set)
+
+    @staticmethod
+    def key(question) -> tuple:
+        return normalize_question(question), tuple(sorted(match_symbols_from_query(question)))
+
+    def get(self, question) -> Optional[CachedAnswer]:
+        key = self.key(question)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and not cached.is_current():
+                self._entries.pop(key, None)
+                cached = None
+        record_cache("answer", hit=cached is not None)
+        return cached
+
+    def put(self, question, answer, figures: List = None, symbols: Iterable[str] = ()):
+        """
+        Caches the answer to `question`, built on the market data of `symbols`, the symbols
+        resolved during the turn, and of the symbols the question mentions.
+        """
+        if not answer:
+            return
+        key = self.key(question)
+        symbols = tuple(sorted(set(key[1]) | set(symbols)))
+        with self._lock:
+            self._entries[key] = CachedAnswer(answer, list(figures or []), symbols, YahooFinData.data_version(symbols))
+            for symbol in symbols:
+                # Forget keys that have expired meanwhile, so the index stays as small as the cache
+                live = {cached for cached in self._keys_by_symbol[symbol] if cached in self._entries}
+                self._keys_by_symbol[symbol] = live | {key}
+
+    def invalidate(self, symbol):
+        """
+        Drops every answer built on the market data of `symbol`.
+        """
+        with self._lock:
+            for key in self._keys_by_symbol.pop(symbol, set()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_symbol.clear()
+
+
+ANSWER_CACHE = AnswerCache()
+YahooFinData.add_invalidation_listener(ANSWER_CACHE.invalidate)
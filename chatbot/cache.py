@@ -0,0 +1,341 @@
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict
+
+from chatbot.concurrency import SingleFlight
+
+# Constants
+CACHE_DIR = os.environ.get(
+    "MARKET_DATA_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "cache")
+)
+MEMORY_CACHE_BYTES = int(os.environ.get("MARKET_DATA_MEMORY_CACHE_BYTES", 256 * 1024 * 1024))
+DISK_CACHE_BYTES = int(os.environ.get("MARKET_DATA_DISK_CACHE_BYTES", 2 * 1024 * 1024 * 1024))
+
+# Time to live in seconds, per data type
+CACHE_TTLS = {
+    "info": 600,
+    "history": 3600,
+}
+DEFAULT_TTL = 600
+
+# The disk tier only refreshes the access time of an entry when it is older than this, so reads rarely write
+ACCESS_UPDATE_INTERVAL = 60
+
+
+class CacheStats:
+    """
+    Hit and miss counters per namespace.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: {"hits": 0, "misses": 0})
+
+    def record(self, namespace, hit):
+        with self._lock:
+            self._counts[namespace]["hits" if hit else "misses"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {namespace: dict(counts) for namespace, counts in self._counts.items()}
+
+
+class CacheBackend(ABC):
+    """
+    Key/value store for market data. Values are stored together with their pickled size
+    so every tier can account for the bytes it holds.
+    """
+
+    @abstractmethod
+    def get(self, namespace, key):
+        """
+        Returns the cached value, or None on a miss or an expired entry.
+        """
+
+    @abstractmethod
+    def set(self, namespace, key, value, ttl, payload=None):
+        """
+        Stores a value for `ttl` seconds. `payload` is the pickled value when the caller already has it.
+        """
+
+    @abstractmethod
+    def delete(self, namespace, key):
+        """
+        Removes a value, does nothing when it is not cached.
+        """
+
+    @abstractmethod
+    def usage(self) -> dict:
+        """
+        Returns the number of entries and bytes held.
+        """
+
+
+class MemoryCache(CacheBackend):
+    """
+    In-process LRU cache bounded by the pickled size of its values.
+    """
+
+    def __init__(self, max_bytes=MEMORY_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (namespace, key) -> (expires_at, size, value)
+        self._bytes = 0
+
+    def get(self, namespace, key):
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                self._remove((namespace, key))
+                return None
+            self._entries.move_to_end((namespace, key))
+            return entry[2]
+
+    def set(self, namespace, key, value, ttl, payload=None):
+        size = len(payload) if payload is not None else len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove((namespace, key))
+            self._entries[(namespace, key)] = (time.time() + ttl, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._remove((namespace, key))
+
+    def _remove(self, cache_key):
+        entry = self._entries.pop(cache_key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def usage(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+class SQLiteCache(CacheBackend):
+    """
+    On-disk cache shared by every worker process on the host.
+
+    SQLite in WAL mode handles concurrent readers and writers across processes. Entries
+    are evicted least recently used first once the stored bytes exceed `max_bytes`. The
+    stored bytes are kept up to date by triggers, so checking the budget is a single-row read.
+    """
+
+    def __init__(self, path, max_bytes=DISK_CACHE_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._connect()
+        # One transaction, so concurrent workers creating the schema see all of it or none
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, size INTEGER NOT NULL,"
+                " expires_at REAL NOT NULL, accessed_at REAL NOT NULL, PRIMARY KEY (namespace, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS usage (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO usage (id, bytes) SELECT 0, COALESCE(SUM(size), 0) FROM entries")
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries"
+                " BEGIN UPDATE usage SET bytes = bytes + NEW.size WHERE id = 0; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries"
+                " BEGIN UPDATE usage SET bytes = bytes + NEW.size - OLD.size WHERE id = 0; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries"
+                " BEGIN UPDATE usage SET bytes = bytes - OLD.size WHERE id = 0; END"
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace, key):
+        value, _, _ = self.get_entry(namespace, key)
+        return value
+
+    def get_entry(self, namespace, key):
+        """
+        Returns the cached value, its expiry time and its pickled payload, all None on a miss.
+        """
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT value, expires_at, accessed_at FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        if row is None:
+            return None, None, None
+        now = time.time()
+        if row[1] < now:
+            conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ? AND expires_at < ?", (namespace, key, now))
+            return None, None, None
+        if now - row[2] > ACCESS_UPDATE_INTERVAL:
+            conn.execute("UPDATE entries SET accessed_at = ? WHERE namespace = ? AND key = ?", (now, namespace, key))
+        try:
+            return pickle.loads(row[0]), row[1], row[0]
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError) as ex:
+            logging.warning(f"Dropping unreadable cache entry {namespace}/{key}: {ex}")
+            self.delete(namespace, key)
+            return None, None, None
+
+    def set(self, namespace, key, value, ttl, payload=None):
+        if payload is None:
+            payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.max_bytes:
+            return
+        now = time.time()
+        conn = self._connect()
+        # An upsert rather than INSERT OR REPLACE, whose implicit delete does not fire the delete trigger
+        conn.execute(
+            "INSERT INTO entries (namespace, key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (namespace, key) DO UPDATE SET"
+            " value = excluded.value, size = excluded.size, expires_at = excluded.expires_at, accessed_at = excluded.accessed_at",
+            (namespace, key, sqlite3.Binary(payload), len(payload), now + ttl, now)
+        )
+        self._evict(conn)
+
+    def delete(self, namespace, key):
+        self._connect().execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+    @staticmethod
+    def _stored_bytes(conn) -> int:
+        return conn.execute("SELECT bytes FROM usage WHERE id = 0").fetchone()[0]
+
+    def _evict(self, conn):
+        if self._stored_bytes(conn) <= self.max_bytes:
+            return
+        conn.execute("DELETE FROM entries WHERE expires_at < ?", (time.time(),))
+        # Drop least recently used entries until the cache is back under 90% of its budget
+        target = int(self.max_bytes * 0.9)
+        freed = 0
+        total = self._stored_bytes(conn)
+        victims = []
+        for namespace, key, size in conn.execute("SELECT namespace, key, size FROM entries ORDER BY accessed_at"):
+            if total - freed <= target:
+                break
+            victims.append((namespace, key))
+            freed += size
+        conn.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", victims)
+
+    def usage(self) -> dict:
+        conn = self._connect()
+        entries = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {"entries": entries, "bytes": self._stored_bytes(conn), "max_bytes": self.max_bytes}
+
+
+class TieredCache(CacheBackend):
+    """
+    In-memory tier in front of the shared on-disk tier. Disk hits are promoted to memory
+    with their remaining time to live.
+    """
+
+    def __init__(self, memory: MemoryCache, disk: SQLiteCache = None):
+        self.memory = memory
+        self.disk = disk
+        self.stats = CacheStats()
+        self._in_flight = SingleFlight()
+
+    def get(self, namespace, key):
+        value = self.memory.get(namespace, key)
+        if value is not None or self.disk is None:
+            return value
+        try:
+            value, expires_at, payload = self.disk.get_entry(namespace, key)
+        except sqlite3.Error as ex:
+            logging.error(f"Failed to read {namespace}/{key} from disk cache: {ex}")
+            return None
+        if value is not None:
+            # The stored payload sizes the entry, no need to pickle the value again
+            self.memory.set(namespace, key, value, expires_at - time.time(), payload=payload)
+        return value
+
+    def set(self, namespace, key, value, ttl=None, payload=None):
+        ttl = ttl if ttl is not None else CACHE_TTLS.get(namespace, DEFAULT_TTL)
+        payload = payload if payload is not None else pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self.memory.set(namespace, key, value, ttl, payload=payload)
+        if self.disk is not None:
+            try:
+                self.disk.set(namespace, key, value, ttl, payload=payload)
+            except sqlite3.Error as ex:
+                logging.error(f"Failed to write {namespace}/{key} to disk cache: {ex}")
+
+    def delete(self, namespace, key):
+        self.memory.delete(namespace, key)
+        if self.disk is not None:
+            try:
+                self.disk.delete(namespace, key)
+            except sqlite3.Error as ex:
+                logging.error(f"Failed to delete {namespace}/{key} from disk cache: {ex}")
+
+    def get_or_load(self, namespace, key, loader, ttl=None):
+        """
+        Returns the cached value, loading and storing it on a miss. Concurrent misses for the
+        same key in this process share one load.
+
+        Args:
+            namespace (str): The data type, also selects the default time to live.
+            key (str): The cache key within the namespace.
+            loader (callable): Fetches the value on a miss.
+            ttl (float): Overrides the time to live of the namespace.
+
+        Returns:
+            Any: The cached or freshly loaded value.
+        """
+        value = self.get(namespace, key)
+        self.stats.record(namespace, hit=value is not None)
+        if value is not None:
+            return value
+
+        def load():
+            cached = self.get(namespace, key)
+            if cached is not None:
+                return cached
+            loaded = loader()
+            if loaded is not None:
+                self.set(namespace, key, loaded, ttl)
+            return loaded
+
+        return self._in_flight.do((namespace, key), load)
+
+    def usage(self) -> dict:
+        usage = {"memory": self.memory.usage()}
+        if self.disk is not None:
+            usage["disk"] = self.disk.usage()
+        return usage
+
+
+def create_market_data_cache() -> TieredCache:
+    """
+    Creates the market data cache, in memory only when the disk tier cannot be opened.
+    """
+    disk = None
+    try:
+        disk = SQLiteCache(os.path.join(CACHE_DIR, "market_data.sqlite"))
+    except (OSError, sqlite3.Error) as ex:
+        logging.error(f"Disk cache unavailable, using memory only: {ex}")
+    return TieredCache(MemoryCache(), disk)
@@ -0,0 +1,273 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+from chatbot.metrics import span
+
+# Point budget per trace, longer series are downsampled before the figure is built
+MAX_CHART_POINTS = 1000
+
+# Coarser bars tried in order until an OHLC history fits the budget
+OHLC_RESAMPLE_RULES = [
+    ("weekly", pd.offsets.Week(weekday=4)),
+    ("monthly", pd.offsets.MonthEnd()),
+    ("quarterly", pd.offsets.QuarterEnd()),
+    ("yearly", pd.offsets.YearEnd()),
+]
+OHLC_AGGREGATIONS = {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"}
+
+# One color per symbol, the same in every panel of a figure
+COLORS = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b", "#e377c2", "#7f7f7f", "#bcbd22", "#17becf"]
+
+
+def downsample_ohlc(hist: pd.DataFrame, max_points=MAX_CHART_POINTS):
+    """
+    Resamples a daily OHLC history to the finest of weekly, monthly, quarterly or yearly
+    bars that fits the point budget. Each bar keeps the first open, highest high, lowest
+    low and last close of the days it covers.
+
+    Args:
+        hist (DataFrame): Daily history indexed by date.
+        max_points (int): The maximum number of bars.
+
+    Returns:
+        tuple: The resampled history and the bar size ("daily" when it already fits).
+    """
+    if len(hist) <= max_points:
+        return hist, "daily"
+    aggregations = {column: how for column, how in OHLC_AGGREGATIONS.items() if column in hist.columns}
+    resampled = hist
+    for bar, rule in OHLC_RESAMPLE_RULES:
+        resampled = hist.resample(rule).agg(aggregations).dropna(subset=["Close"])
+        if len(resampled) <= max_points:
+            return resampled, bar
+    return resampled, bar
+
+
+def lttb(y: np.ndarray, threshold=MAX_CHART_POINTS) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling of a line, keeps its visual peaks and troughs.
+
+    Every bucket is solved at once: the triangle of a point is closed by the averages of
+    the previous and the next bucket, instead of the point picked in the previous bucket,
+    so no bucket waits on the one before it.
+
+    Args:
+        y (ndarray): The line values, evenly spaced.
+        threshold (int): The number of points to keep.
+
+    Returns:
+        ndarray: The indices of the points to keep, first and last included.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    # Points 1 .. n-2 split into threshold-2 buckets of at least one point each
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    starts, counts = edges[:-1], np.diff(edges)
+    buckets = np.repeat(np.arange(len(starts)), counts)
+    x = np.arange(1, n - 1, dtype=float)
+    inner = y[1:n - 1]
+
+    avg_x = (starts + edges[1:] - 1) / 2
+    avg_y = np.add.reduceat(inner, starts - 1) / counts
+    prev_x = np.concatenate([[0.0], avg_x[:-1]])[buckets]
+    prev_y = np.concatenate([[y[0]], avg_y[:-1]])[buckets]
+    next_x = np.concatenate([avg_x[1:], [n - 1.0]])[buckets]
+    next_y = np.concatenate([avg_y[1:], [y[-1]]])[buckets]
+    areas = np.abs((prev_x - next_x) * (inner - prev_y) - (prev_x - x) * (next_y - prev_y))
+
+    # First point reaching its bucket's largest area
+    largest = np.flatnonzero(areas == np.maximum.reduceat(areas, starts - 1)[buckets])
+    _, first = np.unique(buckets[largest], return_index=True)
+    return np.concatenate([[0], largest[first] + 1, [n - 1]])
+
+
+def resample_returns(returns: pd.Series, max_points=MAX_CHART_POINTS):
+    """
+    Compounds daily returns into the finest of weekly, monthly, quarterly or yearly periods
+    that fits the point budget. Bars are point values, they are aggregated rather than sampled.
+
+    Args:
+        returns (Series): Daily returns indexed by date.
+        max_points (int): The maximum number of bars.
+
+    Returns:
+        tuple: The period returns and the period ("daily" when it already fits).
+    """
+    if len(returns) <= max_points:
+        return returns, "daily"
+    resampled = returns
+    for bar, rule in OHLC_RESAMPLE_RULES:
+        resampled = (1.0 + returns).resample(rule).prod() - 1
+        if len(resampled) <= max_points:
+            return resampled, bar
+    return resampled, bar
+
+
+def _typed(values) -> np.ndarray:
+    # float32 numpy arrays are sent as binary typed arrays by Plotly >= 6, at half the size of float64
+    return np.asarray(values, dtype=np.float32)
+
+
+@span("chart", chart="price_history")
+def price_history_chart(hist: pd.DataFrame, title) -> go.Figure:
+    """
+    Builds an OHLC chart, resampled to coarser bars when the history exceeds the point budget.
+
+    Args:
+        hist (DataFrame): Daily history indexed by date.
+        title (str): The figure title.
+
+    Returns:
+        go.Figure: The OHLC figure.
+    """
+    bars, bar_size = downsample_ohlc(hist)
+    if bar_size != "daily":
+        title = f"{title} ({bar_size} bars)"
+    fig = go.Figure(
+        data=go.Ohlc(
+            x=bars.index,
+            open=_typed(bars["Open"]),
+            high=_typed(bars["High"]),
+            low=_typed(bars["Low"]),
+            close=_typed(bars["Close"])
+        )
+    )
+    fig.update_layout(title=title)
+    return fig
+
+
+@span("chart", chart="performance_snapshot")
+def performance_snapshot(returns: pd.Series, title) -> go.Figure:
+    """
+    Builds the cumulative return, drawdown and daily return panels of a returns series,
+    the same panels as `qs.plots.snapshot`, directly in Plotly. Longer histories show
+    weekly or coarser returns in the last panel.
+
+    Args:
+        returns (Series): Daily returns indexed by date.
+        title (str): The figure title.
+
+    Returns:
+        go.Figure: The three-panel figure, values in percent.
+    """
+    returns = returns.fillna(0)
+    daily = returns.to_numpy(dtype=float)
+    wealth = np.cumprod(1.0 + daily)
+    # Drawdown from the running peak, starting from the initial equity of 1
+    drawdown = wealth / np.maximum(np.maximum.accumulate(wealth), 1.0) - 1
+    dates = returns.index
+    # Each panel keeps its own most significant points
+    cumulative_points = lttb(wealth)
+    drawdown_points = lttb(drawdown)
+    period_returns, period = resample_returns(returns)
+
+    fig = make_subplots(
+        rows=3, cols=1, shared_xaxes=True, vertical_spacing=0.04, row_heights=[0.5, 0.25, 0.25],
+        subplot_titles=("Cumulative Return", "Drawdown", f"{period.capitalize()} Return")
+    )
+    fig.add_trace(
+        go.Scatter(
+            x=dates[cumulative_points], y=_typed((wealth[cumulative_points] - 1) * 100),
+            name="Cumulative Return", line=dict(width=1.5)
+        ),
+        row=1, col=1
+    )
+    fig.add_trace(
+        go.Scatter(
+            x=dates[drawdown_points], y=_typed(drawdown[drawdown_points] * 100),
+            name="Drawdown", fill="tozeroy", line=dict(width=1, color="#d62728")
+        ),
+        row=2, col=1
+    )
+    fig.add_trace(
+        go.Bar(
+            x=period_returns.index, y=_typed(period_returns.to_numpy(dtype=float) * 100),
+            name=f"{period.capitalize()} Return", marker_color="#7f7f7f"
+        ),
+        row=3, col=1
+    )
+    fig.update_yaxes(ticksuffix="%")
+    fig.update_layout(title=title, showlegend=False, bargap=0)
+    return fig
+
+
+@span("chart", chart="comparison")
+def comparison_chart(cumulative: pd.DataFrame, rolling_sharpe: pd.DataFrame, benchmark, title) -> go.Figure:
+    """
+    Overlays the cumulative returns and the rolling Sharpe ratios of several symbols in one figure.
+
+    Args:
+        cumulative (DataFrame): Cumulative returns, dates x symbols.
+        rolling_sharpe (DataFrame): Rolling Sharpe ratios, dates x symbols.
+        benchmark (str): The benchmark column, drawn dashed.
+        title (str): The figure title.
+
+    Returns:
+        go.Figure: The two-panel figure, cumulative returns in percent.
+    """
+    fig = make_subplots(
+        rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.06, row_heights=[0.65, 0.35],
+        subplot_titles=("Cumulative Return", "Rolling Sharpe")
+    )
+    for row, frame in enumerate((cumulative, rolling_sharpe), start=1):
+        dates = frame.index
+        for i, symbol in enumerate(frame.columns):
+            values = frame[symbol].to_numpy(dtype=float)
+            points = lttb(np.nan_to_num(values))
+            fig.add_trace(
+                go.Scatter(
+                    x=dates[points], y=_typed(values[points] * (100 if row == 1 else 1)),
+                    name=symbol, legendgroup=symbol, showlegend=row == 1,
+                    line=dict(width=1.5, dash="dash" if symbol == benchmark else "solid", color=COLORS[i % len(COLORS)])
+                ),
+                row=row, col=1
+            )
+    fig.update_yaxes(ticksuffix="%", row=1, col=1)
+    fig.update_layout(title=title)
+    return fig
+
+
+@span("chart", chart="portfolio")
+def portfolio_chart(returns: pd.Series, title) -> go.Figure:
+    """
+    Builds the equity curve and drawdown panels of a portfolio returns series.
+
+    Args:
+        returns (Series): Daily portfolio returns indexed by date.
+        title (str): The figure title.
+
+    Returns:
+        go.Figure: The two-panel figure, values in percent.
+    """
+    wealth = np.cumprod(1.0 + returns.fillna(0).to_numpy(dtype=float))
+    drawdown = wealth / np.maximum(np.maximum.accumulate(wealth), 1.0) - 1
+    dates = returns.index
+    equity_points = lttb(wealth)
+    drawdown_points = lttb(drawdown)
+
+    fig = make_subplots(
+        rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.06, row_heights=[0.65, 0.35],
+        subplot_titles=("Equity", "Drawdown")
+    )
+    fig.add_trace(
+        go.Scatter(
+            x=dates[equity_points], y=_typed((wealth[equity_points] - 1) * 100),
+            name="Equity", line=dict(width=1.5)
+        ),
+        row=1, col=1
+    )
+    fig.add_trace(
+        go.Scatter(
+            x=dates[drawdown_points], y=_typed(drawdown[drawdown_points] * 100),
+            name="Drawdown", fill="tozeroy", line=dict(width=1, color="#d62728")
+        ),
+        row=2, col=1
+    )
+    fig.update_yaxes(ticksuffix="%")
+    fig.update_layout(title=title, showlegend=False)
+    return fig
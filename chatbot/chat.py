@@ -0,0 +1,268 @@
+import asyncio
+import contextlib
+import contextvars
+import datetime
+import time
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
+from langchain_core.runnables import RunnableConfig, RunnablePassthrough
+
+from chatbot import llm
+from chatbot.answer_cache import ANSWER_CACHE
+from chatbot.executor import stream_tool_calls
+from chatbot.metrics import observe_since, span
+from chatbot.prefetch import start_prefetch
+from chatbot.prompt import DEFAULT_PROMPT, SYNTHETIC_CONTINUE_PROMPT, SYNTHETIC_PROMPT
+from chatbot.router import route_question
+from chatbot.serializer import serialize_tool_results
+from chatbot.services import current_session, resolution_context
+from chatbot.session import SessionContext
+from chatbot.tool import (
+    get_company_info, get_stock_trading_info, get_financial_info,
+    return_default_query, get_performance_stats, show_stock_performance, show_price_volume_history, compare_assets,
+    get_portfolio_performance, TICKER_HANDLERS
+)
+
+# Seconds to wait for more tool results before a synthesis round starts
+SYNTHESIS_BATCH_WINDOW = 0.3
+
+# When the message being answered arrived, for the time to first and last token
+MESSAGE_STARTED = contextvars.ContextVar("message_started", default=None)
+
+AVAILABLE_TOOLS = {
+    "get_company_info": get_company_info,
+    "get_stock_trading_info": get_stock_trading_info,
+    "get_financial_info": get_financial_info,
+    "return_default_query": return_default_query,
+    "show_price_volume_history": show_price_volume_history,
+    "show_stock_performance": show_stock_performance,
+    "get_performance_stats": get_performance_stats,
+    "compare_assets": compare_assets,
+    "get_portfolio_performance": get_portfolio_performance
+}
+
+
+class ChatOutput:
+    """
+    Receives the answer of a chat turn as it is written. This one discards it; the Chainlit
+    app streams it into a message, the benchmarks time it.
+
+    A turn opens one answer, then sends its tokens and figures in any order and closes it.
+    """
+
+    def step(self, name):
+        """
+        Context manager around a stage of the turn, such as `function_calling`.
+        """
+        return contextlib.nullcontext()
+
+    def callbacks(self) -> list:
+        """
+        LangChain callbacks of the model calls.
+        """
+        return []
+
+    async def open(self):
+        pass
+
+    async def token(self, chunk):
+        pass
+
+    async def figure(self, fig):
+        pass
+
+    async def close(self):
+        pass
+
+
+@lru_cache(maxsize=1)
+def get_llm_with_tools():
+    # Bound on first use, importing the app does not create the function calling client
+    return llm.FUNCTION_CALLING_LLM.bind_tools([tool for tool in AVAILABLE_TOOLS.values()])
+
+
+async def stream_default_qa(question, output: ChatOutput):
+    async with output.step("stream_default_qa"):
+        output_msg = ""
+        chain = (
+            {"question": RunnablePassthrough()}
+            | PromptTemplate(
+                template=DEFAULT_PROMPT,
+                input_variables=["question"],
+                partial_variables={"today": datetime.datetime.now()}
+            )
+            | llm.SYNTHETIC_LLM
+            | StrOutputParser()
+        )
+        await output.open()
+        async for chunk in chain.astream(question, config=RunnableConfig(callbacks=output.callbacks())):
+            if not output_msg:
+                observe_since("first_token", MESSAGE_STARTED.get(), path="default")
+            await output.token(chunk)
+            output_msg += chunk
+
+        observe_since("last_token", MESSAGE_STARTED.get(), path="default")
+        await output.close()
+        return output_msg
+
+
+def synthesis_chain(data, answer=""):
+    partial_variables = {
+        "data": serialize_tool_results(data),
+        "today": datetime.datetime.now()
+    }
+    template = SYNTHETIC_PROMPT
+    if answer:
+        # The final round extends the answer already streamed with the results that arrived since
+        template = SYNTHETIC_CONTINUE_PROMPT
+        partial_variables["answer"] = answer
+    return (
+        {"question": RunnablePassthrough()}
+        | PromptTemplate(
+            template=template,
+            input_variables=["question"],
+            partial_variables=partial_variables
+        )
+        | llm.SYNTHETIC_LLM
+        | StrOutputParser()
+    )
+
+
+async def stream_synthetic(question, tool_calls, output: ChatOutput) -> Tuple[Optional[str], List]:
+    """
+    Streams the answer while the tools are still running. Figures are sent as soon as
+    each one is ready, and the answer is written in at most two rounds: the first starts on
+    the first results, the second adds the rest once every tool has finished.
+
+    Returns the answer and the figures, the answer is None when no tool returned anything.
+    """
+    async with output.step("stream_synthetic"):
+        results = list()
+        figures = list()
+        updated = asyncio.Event()
+
+        async def collect():
+            try:
+                async for result in stream_tool_calls(AVAILABLE_TOOLS, tool_calls, TICKER_HANDLERS):
+                    if not results:
+                        await output.open()
+                    fig = result.pop('fig', None)
+                    if fig is not None:
+                        figures.append(fig)
+                        await output.figure(fig)
+                    results.append(result)
+                    updated.set()
+            finally:
+                updated.set()
+
+        collector = asyncio.create_task(collect())
+        output_msg = ""
+        synthesized = 0
+        try:
+            while True:
+                if synthesized == len(results):
+                    if collector.done():
+                        break
+                    await updated.wait()
+                    updated.clear()
+                    continue
+
+                if synthesized:
+                    # The final round covers everything after the first, so there are at most two
+                    await asyncio.wait([collector])
+                else:
+                    # Results of one tool tend to land together, give the rest of a burst a moment
+                    await asyncio.wait([collector], timeout=SYNTHESIS_BATCH_WINDOW)
+                batch = results[synthesized:]
+                synthesized += len(batch)
+                if output_msg:
+                    await output.token("\n\n")
+                    output_msg += "\n\n"
+                async for chunk in synthesis_chain(batch, output_msg).astream(
+                    question,
+                    config=RunnableConfig(callbacks=output.callbacks()),
+                ):
+                    if not output_msg:
+                        observe_since("first_token", MESSAGE_STARTED.get(), path="tools")
+                    await output.token(chunk)
+                    output_msg += chunk
+            collector.result()
+        finally:
+            collector.cancel()
+
+        if not results:
+            return None, figures
+
+        observe_since("last_token", MESSAGE_STARTED.get(), path="tools")
+        await output.close()
+        return output_msg, figures
+
+
+@span("function_calling")
+async def function_calling(question, output: ChatOutput):
+    async with output.step("function_calling"):
+        session = current_session()
+        tool_calls = route_question(question, follow_up=session is not None and session.is_follow_up(question))
+        if tool_calls is None:
+            # Warm the market data while the function calling model is thinking
+            prefetch_task = start_prefetch(question)
+            response_tools = await get_llm_with_tools().ainvoke(question)
+            tool_calls = response_tools.tool_calls
+            if prefetch_task is not None and not tool_calls:
+                prefetch_task.cancel()
+        return tool_calls
+
+
+async def replay_cached_answer(cached, output: ChatOutput):
+    async with output.step("replay_cached_answer"):
+        await output.open()
+        for chunk in cached.chunks():
+            await output.token(chunk)
+
+        for figure in cached.figures:
+            await output.figure(figure)
+
+        await output.close()
+        return cached.answer
+
+
+async def answer_question(question, session: Optional[SessionContext] = None, output: Optional[ChatOutput] = None) -> str:
+    """
+    Answers one message of a chat session: from the answer cache, or by routing or function
+    calling, streaming the tool results into the synthesis, and falling back to a plain
+    answer when no tool returned anything.
+
+    Args:
+        question (str): The user message.
+        session (SessionContext): The state of the chat session, None for a one-off question.
+        output (ChatOutput): Receives the answer as it is written.
+
+    Returns:
+        str: The answer.
+    """
+    output = output or ChatOutput()
+    MESSAGE_STARTED.set(time.perf_counter())
+    # A follow-up depends on the previous turns, its answer is not shared through the answer cache
+    contextual = session is not None and session.is_follow_up(question)
+    cached = None if contextual else ANSWER_CACHE.get(question)
+    if cached is not None:
+        output_msg = await replay_cached_answer(cached, output)
+        observe_since("message", MESSAGE_STARTED.get(), path="cached")
+        return output_msg
+
+    with resolution_context(session) as context:
+        tool_calls = await function_calling(question, output)
+        output_msg, figures = await stream_synthetic(question, tool_calls, output)
+
+    if output_msg is None:
+        output_msg = await stream_default_qa(question, output)
+        observe_since("message", MESSAGE_STARTED.get(), path="default")
+    else:
+        observe_since("message", MESSAGE_STARTED.get(), path="tools")
+
+    if not contextual:
+        ANSWER_CACHE.put(question, output_msg, figures, context.resolved_symbols())
+    return output_msg
@@ -0,0 +1,86 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+TOOL_MAX_WORKERS = int(os.environ.get("TOOL_MAX_WORKERS", 8))
+
+# Shared, bounded pool for blocking work (Yahoo HTTP, sync LLM calls) so the event loop is never blocked
+_EXECUTOR = ThreadPoolExecutor(max_workers=TOOL_MAX_WORKERS, thread_name_prefix="quant-tool")
+
+
+async def run_in_executor(func, *args, **kwargs):
+    """
+    Runs a blocking callable on the shared pool without blocking the event loop.
+
+    The caller's context variables are copied into the worker thread, so per-request
+    state set in the handler is visible to the callable.
+
+    Args:
+        func (callable): The blocking callable.
+        *args: Positional arguments for the callable.
+        **kwargs: Keyword arguments for the callable.
+
+    Returns:
+        Any: The value returned by the callable.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_EXECUTOR, functools.partial(ctx.run, func, *args, **kwargs))
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into a single in-flight call.
+
+    The first caller runs the function; callers arriving while it is running wait for
+    its result instead of repeating the work. Nothing is kept once the call finishes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = func(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as ex:
+            future.set_exception(ex)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+
+class AsyncSingleFlight:
+    """
+    `SingleFlight` for coroutines on one event loop.
+
+    The call runs as its own task, so a caller being cancelled does not cancel the call
+    the other callers are waiting on.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, func, *args, **kwargs):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._calls.pop(key, None) if self._calls.get(key) is done else None)
+        return await asyncio.shield(task)
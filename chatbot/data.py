@@ -1,24 +1,264 @@
-from cachetools import TTLCache
-import yfinance as yf
+import time
+from typing import Dict, List, Optional
+
+import pandas as pd
 import logging
-import quantstats as qs
 
-from cachetools.func import ttl_cache
+from chatbot.cache import create_market_data_cache
+from chatbot.concurrency import SingleFlight
+from chatbot.metrics import METRICS, span
+from chatbot.timeseries import PriceHistoryStore
+
+# Periods accepted by `yf.Ticker.history`, sliced from the cached full-range history
+PERIOD_BARS = {"1d": 1, "5d": 5}
+PERIOD_OFFSETS = {
+    "1mo": pd.DateOffset(months=1),
+    "3mo": pd.DateOffset(months=3),
+    "6mo": pd.DateOffset(months=6),
+    "1y": pd.DateOffset(years=1),
+    "2y": pd.DateOffset(years=2),
+    "5y": pd.DateOffset(years=5),
+    "10y": pd.DateOffset(years=10),
+}
+
+
+def slice_period(frame: pd.DataFrame, period) -> pd.DataFrame:
+    """
+    Slices a daily history frame to a `yf.Ticker.history` period, counted back from its last bar.
+    """
+    if frame.empty or period == "max":
+        return frame
+    if period in PERIOD_BARS:
+        return frame.iloc[-PERIOD_BARS[period]:]
+    end = frame.index[-1]
+    if period == "ytd":
+        start = pd.Timestamp(year=end.year, month=1, day=1)
+        return frame[frame.index >= start]
+    if period in PERIOD_OFFSETS:
+        return frame[frame.index > end - PERIOD_OFFSETS[period]]
+    logging.warning(f"Unknown period {period}, returning the full history")
+    return frame
+
+
+class TickerInfo:
+    """
+    Snapshot of `yf.Ticker.info` for one symbol, fetched once and shared by every info reader.
+    """
+
+    def __init__(self, symbol, data: dict, fetched_at: float):
+        self.symbol = symbol
+        self.data = data
+        self.fetched_at = fetched_at
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+    def __repr__(self):
+        return f"TickerInfo(symbol={self.symbol}, fields={len(self.data)}, age={self.age:.0f}s)"
 
 
 class YahooFinData:
-    _ticker_info_cache = TTLCache(maxsize=1024, ttl=600)
+    # Shared by every worker on the host, see chatbot/cache.py
+    cache = create_market_data_cache()
+    history_store = PriceHistoryStore()
+    _in_flight = SingleFlight()
+    _invalidation_listeners = list()
+
+    @staticmethod
+    def data_version(symbols: List[str]) -> tuple:
+        """
+        Returns the data version of each symbol, in order, read from the cached data itself:
+        when its info snapshot was fetched, and the first and last bars of its history.
+        Every worker sharing the cache sees the same version, also after a restart.
+        """
+        return tuple(
+            (YahooFinData._info_version(symbol), YahooFinData._history_version(symbol)) for symbol in symbols
+        )
+
+    @staticmethod
+    def _info_version(symbol) -> Optional[float]:
+        info = YahooFinData.cache.get("info", symbol)
+        return info.fetched_at if info is not None else None
 
     @staticmethod
-    def get_instance(symbol) -> yf.Ticker:
-        if symbol not in YahooFinData._ticker_info_cache:
-            logging.info(f"Create ticker {symbol}")
-            YahooFinData._ticker_info_cache[symbol] = yf.Ticker(symbol)
+    def _history_version(symbol) -> Optional[tuple]:
+        frame = YahooFinData.cache.memory.get("history", symbol)
+        if frame is None:
+            frame = YahooFinData.history_store.load(symbol)
+        if frame is None or frame.empty:
+            return None
+        # The last bar is replaced during the session, and re-adjusted prices change the first one
+        closes = frame["Close"] if "Close" in frame.columns else frame.iloc[:, 0]
+        return frame.index[-1], float(closes.iloc[0]), float(closes.iloc[-1])
 
-        return YahooFinData._ticker_info_cache[symbol]
+    @staticmethod
+    def add_invalidation_listener(listener):
+        """
+        Registers `listener(symbol)`, called whenever fresh data is loaded for a symbol.
+        """
+        YahooFinData._invalidation_listeners.append(listener)
+
+    @staticmethod
+    def _data_loaded(symbol):
+        for listener in YahooFinData._invalidation_listeners:
+            try:
+                listener(symbol)
+            except Exception as ex:
+                logging.error(f"Invalidation listener failed for {symbol}: {ex}")
 
     @staticmethod
-    @ttl_cache(ttl=3600, maxsize=2048)
-    def download_stock_returns(symbol):
-        returns = qs.utils.download_returns(symbol)
-        return returns
+    def get_info(symbol, refresh=False) -> TickerInfo:
+        """
+        Returns the cached info snapshot of a symbol, fetching it on a miss.
+
+        Args:
+            symbol (str): The ticker symbol.
+            refresh (bool): Drop the cached snapshot and fetch a new one.
+
+        Returns:
+            TickerInfo: The info snapshot, valid for the `info` TTL of the market data cache.
+        """
+        if refresh:
+            YahooFinData.cache.delete("info", symbol)
+        return YahooFinData.cache.get_or_load("info", symbol, lambda: YahooFinData._fetch_info(symbol))
+
+    @staticmethod
+    @span("yahoo_info")
+    def _fetch_info(symbol) -> TickerInfo:
+        import yfinance as yf
+
+        logging.info(f"Fetch info {symbol}")
+        info = TickerInfo(symbol, yf.Ticker(symbol).info, time.time())
+        YahooFinData._data_loaded(symbol)
+        return info
+
+    @staticmethod
+    def get_histories(symbols: List[str], period="max") -> Dict[str, pd.DataFrame]:
+        """
+        Returns the daily OHLCV history of several symbols.
+
+        Full-range histories are kept in the price history store. Stale ones are refreshed
+        with only the bars after their last stored bar, and symbols seen for the first time
+        are downloaded in one request.
+
+        Args:
+            symbols (list): The ticker symbols.
+            period (str): One of 1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max.
+
+        Returns:
+            dict: The history of each symbol that has data, indexed by date.
+        """
+        store = YahooFinData.history_store
+        histories = dict()
+        stale = dict()
+        missing = list()
+        for symbol in dict.fromkeys(symbols):
+            frame = YahooFinData.cache.memory.get("history", symbol)
+            if frame is None:
+                stored = store.load(symbol)
+                if stored is None or stored.empty:
+                    missing.append(symbol)
+                elif store.is_fresh(symbol):
+                    frame = stored
+                    YahooFinData.cache.memory.set("history", symbol, frame, store.refresh_interval)
+                else:
+                    stale[symbol] = stored
+            YahooFinData.cache.stats.record("history", hit=frame is not None)
+            if frame is not None:
+                histories[symbol] = frame
+
+        if stale:
+            key = ("refresh",) + tuple(sorted(stale))
+            histories.update(YahooFinData._in_flight.do(key, YahooFinData._refresh_histories, stale))
+        if missing:
+            key = ("download",) + tuple(sorted(missing))
+            histories.update(YahooFinData._in_flight.do(key, YahooFinData._download_full_histories, missing))
+
+        return {symbol: slice_period(frame, period) for symbol, frame in histories.items()}
+
+    @staticmethod
+    def _download_full_histories(symbols: List[str]) -> Dict[str, pd.DataFrame]:
+        store = YahooFinData.history_store
+        histories = YahooFinData._download_histories(symbols)
+        for symbol, frame in histories.items():
+            store.save(symbol, frame)
+            YahooFinData.cache.memory.set("history", symbol, frame, store.refresh_interval)
+            YahooFinData._data_loaded(symbol)
+        return histories
+
+    @staticmethod
+    def _refresh_histories(stale: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+        store = YahooFinData.history_store
+        start = min(store.refresh_start(stored) for stored in stale.values())
+        updates = YahooFinData._download_histories(list(stale), start=start)
+        histories = dict()
+        redownload = list()
+        for symbol, stored in stale.items():
+            update = updates.get(symbol, pd.DataFrame())
+            update = update[update.index >= store.refresh_start(stored)]
+            frame = store.append(symbol, stored, update)
+            if frame is None:
+                redownload.append(symbol)
+                continue
+            YahooFinData.cache.memory.set("history", symbol, frame, store.refresh_interval)
+            if frame is not stored:
+                YahooFinData._data_loaded(symbol)
+            histories[symbol] = frame
+
+        if redownload:
+            histories.update(YahooFinData._download_full_histories(redownload))
+        return histories
+
+    @staticmethod
+    def _download_histories(symbols: List[str], start=None) -> Dict[str, pd.DataFrame]:
+        import yfinance as yf
+
+        if start is None:
+            logging.info(f"Download history {symbols}")
+            with span("yahoo_history", mode="full"):
+                data = yf.download(symbols, period="max", group_by="ticker", auto_adjust=True, threads=True, progress=False)
+        else:
+            logging.info(f"Download history {symbols} from {start:%Y-%m-%d}")
+            with span("yahoo_history", mode="incremental"):
+                data = yf.download(symbols, start=start, group_by="ticker", auto_adjust=True, threads=True, progress=False)
+
+        histories = dict()
+        for symbol in symbols:
+            if data is None:
+                break
+            if isinstance(data.columns, pd.MultiIndex):
+                if symbol not in data.columns.get_level_values(0):
+                    continue
+                frame = data[symbol]
+            else:
+                frame = data
+            frame = frame.dropna(how="all")
+            if frame.empty:
+                logging.warning(f"No history for {symbol}")
+                continue
+            if frame.index.tz is not None:
+                frame = frame.tz_localize(None)
+            frame.index.name = "Date"
+            histories[symbol] = frame
+        return histories
+
+    @staticmethod
+    def get_returns(symbols: List[str]) -> Dict[str, pd.Series]:
+        """
+        Returns the daily returns of several symbols, computed from the cached closes.
+
+        Matches `qs.utils.download_returns`: adjusted close to close change, first day 0.
+        """
+        return {
+            symbol: frame["Close"].pct_change(fill_method=None).fillna(0).rename(symbol)
+            for symbol, frame in YahooFinData.get_histories(symbols).items()
+        }
+
+
+METRICS.register_collector(
+    lambda: {f"market_data_{namespace}": counts for namespace, counts in YahooFinData.cache.stats.snapshot().items()}
+)
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import os
+from typing import AsyncIterator, Dict, List, Optional
+
+from chatbot.concurrency import run_in_executor
+from chatbot.metrics import span
+from chatbot.services import current_session, get_ticker_from_query
+
+DEFAULT_TOOL_TIMEOUT = float(os.environ.get("TOOL_TIMEOUT", 30))
+
+# Per-tool overrides, chart tools download the full history and need more time
+TOOL_TIMEOUTS = {
+    "show_price_volume_history": 60,
+    "show_stock_performance": 60,
+    "get_performance_stats": 60,
+    "compare_assets": 60,
+    "get_portfolio_performance": 60,
+}
+
+
+async def _invoke_tool(tool, tool_call):
+    timeout = TOOL_TIMEOUTS.get(tool_call['name'], DEFAULT_TOOL_TIMEOUT)
+    try:
+        with span("tool", tool=tool_call['name']):
+            return await asyncio.wait_for(run_in_executor(tool.invoke, tool_call['args']), timeout=timeout)
+    except asyncio.TimeoutError:
+        logging.error(f"Tool {tool_call['name']} timed out after {timeout}s")
+    except Exception as ex:
+        logging.error(f"Tool {tool_call['name']} failed: {ex}")
+    return None
+
+
+async def _preload_tickers(handler, tool_call, symbols, args) -> Optional[dict]:
+    if handler.preload is None:
+        return dict()
+    timeout = TOOL_TIMEOUTS.get(tool_call['name'], DEFAULT_TOOL_TIMEOUT)
+    try:
+        with span("tool_preload", tool=tool_call['name']):
+            return await asyncio.wait_for(run_in_executor(handler.preload, symbols, **args), timeout=timeout)
+    except asyncio.TimeoutError:
+        logging.error(f"Tool {tool_call['name']} timed out loading {symbols} after {timeout}s")
+    except Exception as ex:
+        logging.error(f"Tool {tool_call['name']} failed loading {symbols}: {ex}")
+    return None
+
+
+async def _invoke_ticker_handler(handler, tool_call, symbol, args, preloaded):
+    session = current_session()
+    timeout = TOOL_TIMEOUTS.get(tool_call['name'], DEFAULT_TOOL_TIMEOUT)
+    try:
+        with span("tool", tool=tool_call['name']):
+            result = await asyncio.wait_for(run_in_executor(handler.handle, symbol, **args, **preloaded), timeout=timeout)
+        if session is not None and result:
+            session.put_payload(tool_call['name'], symbol, args, result)
+        return result
+    except asyncio.TimeoutError:
+        logging.error(f"Tool {tool_call['name']} timed out for {symbol} after {timeout}s")
+    except Exception as ex:
+        logging.error(f"Tool {tool_call['name']} failed for {symbol}: {ex}")
+    return None
+
+
+def _validate_args(tool, tool_call) -> dict:
+    # Checked against the schema the model was given, like `tool.invoke` does; arguments
+    # left out stay out, so the handler defaults apply and session payloads share keys
+    return tool.args_schema.model_validate(tool_call['args']).model_dump(exclude_unset=True)
+
+
+async def _stream_tool_call(available_tools: Dict, ticker_handlers: Dict, tool_call: dict, queue: asyncio.Queue):
+    logging.info(f"Call tool : {tool_call}")
+    tool = available_tools.get(tool_call['name'])
+    if tool is None:
+        logging.error(f"Tool {tool_call['name']} does not exist")
+        return
+    handler = ticker_handlers.get(tool_call['name'])
+    if handler is None:
+        for result in await _invoke_tool(tool, tool_call) or []:
+            queue.put_nowait(result)
+        return
+
+    try:
+        args = _validate_args(tool, tool_call)
+        question = args.pop('question')
+    except (KeyError, ValueError) as ex:
+        logging.error(f"Tool {tool_call['name']} got invalid arguments: {ex}")
+        return
+
+    try:
+        tickers = await asyncio.wait_for(run_in_executor(get_ticker_from_query, question), timeout=DEFAULT_TOOL_TIMEOUT)
+    except Exception as ex:
+        logging.error(f"Tool {tool_call['name']} could not resolve tickers: {ex!r}")
+        return
+
+    # Results of the previous turns of the chat session are reused as long as their data is current
+    session = current_session()
+    symbols = list()
+    for symbol in dict.fromkeys(ticker.symbol for ticker in tickers):
+        cached = session.get_payload(tool_call['name'], symbol, args) if session is not None else None
+        if cached is not None:
+            queue.put_nowait(cached)
+        else:
+            symbols.append(symbol)
+    if not symbols:
+        return
+
+    # The data of every ticker is loaded in one batch, then each ticker is handled on its own
+    preloaded = await _preload_tickers(handler, tool_call, symbols, args)
+    if preloaded is None:
+        return
+
+    async def run(symbol):
+        result = await _invoke_ticker_handler(handler, tool_call, symbol, args, preloaded)
+        if result:
+            queue.put_nowait(result)
+
+    await asyncio.gather(*(run(symbol) for symbol in symbols))
+
+
+async def stream_tool_calls(
+        available_tools: Dict, tool_calls: List[dict], ticker_handlers: Optional[Dict] = None
+) -> AsyncIterator[dict]:
+    """
+    Runs the tool calls concurrently and yields each result as soon as it is ready.
+
+    Tools with a per-ticker handler load the data of all their tickers in one batch, then
+    handle each ticker on its own, so one slow ticker does not hold back the others; the
+    other tools yield their results once they return.
+
+    Args:
+        available_tools (dict): Mapping of tool name to tool.
+        tool_calls (list): The tool calls, as returned in `AIMessage.tool_calls`.
+        ticker_handlers (dict): Mapping of tool name to `TickerHandler`, see `chatbot.tool.TICKER_HANDLERS`.
+
+    Returns:
+        AsyncIterator[dict]: The tool results in completion order, figures still under `'fig'`.
+    """
+    queue = asyncio.Queue()
+    finished = object()
+
+    async def run(tool_call):
+        try:
+            await _stream_tool_call(available_tools, ticker_handlers or {}, tool_call, queue)
+        finally:
+            queue.put_nowait(finished)
+
+    tasks = [asyncio.ensure_future(run(tool_call)) for tool_call in tool_calls]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            result = await queue.get()
+            if result is finished:
+                remaining -= 1
+            else:
+                yield result
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,124 @@
+from typing import Dict, List, Optional, Tuple
+
+from chatbot.data import TickerInfo
+
+# Output field -> (key in `yf.Ticker.info`, default when the key is missing)
+FieldSchema = Dict[str, Tuple[str, object]]
+
+COMPANY_INFO_FIELDS: FieldSchema = {
+    "symbol": ("symbol", ""),
+    "exchange": ("exchange", ""),
+    "address": ("address1", ""),
+    "city": ("city", ""),
+    "state": ("state", ""),
+    "zip": ("zip", ""),
+    "country": ("country", ""),
+    "phone": ("phone", ""),
+    "website": ("website", ""),
+    "industry": ("industry", ""),
+    "sector": ("sector", ""),
+    "longBusinessSummary": ("longBusinessSummary", ""),
+    "longName": ("longName", ""),
+    "shortName": ("shortName", ""),
+    "fullTimeEmployees": ("fullTimeEmployees", ""),
+    "companyOfficers": ("companyOfficers", []),
+}
+
+TRADING_INFO_FIELDS: FieldSchema = {
+    "symbol": ("symbol", ""),
+    "exchange": ("exchange", ""),
+    "regularMarketPrice": ("regularMarketPrice", ""),
+    "regularMarketOpen": ("regularMarketOpen", ""),
+    "regularMarketPreviousClose": ("regularMarketPreviousClose", ""),
+    "regularMarketVolume": ("regularMarketVolume", ""),
+    "regularMarketDayHigh": ("regularMarketDayHigh", ""),
+    "regularMarketDayLow": ("regularMarketDayLow", ""),
+    "regularMarketDayRange": ("regularMarketDayRange", ""),
+    "regularMarketBid": ("regularMarketBid", ""),
+    "regularMarketAsk": ("regularMarketAsk", ""),
+    "marketCap": ("marketCap", ""),
+    "beta": ("beta", ""),
+    "trailingPE": ("trailingPE", ""),
+    "forwardPE": ("forwardPE", ""),
+    "eps": ("eps", ""),
+    "enterpriseValue": ("enterpriseValue", 0),
+    "currency": ("currency", ""),
+    "pegRatio": ("pegRatio", 0),
+    "priceToSalesTrailing12Months": ("priceToSalesTrailing12Months", 0),
+    "priceToBook": ("priceToBook", 0),
+    "enterpriseToRevenue": ("enterpriseToRevenue", 0),
+    "enterpriseToEbitda": ("enterpriseToEbitda", 0),
+    "priceHint": ("priceHint", 0),
+    "previousClose": ("previousClose", 0),
+    "open": ("open", 0),
+    "dayLow": ("dayLow", 0),
+    "dayHigh": ("dayHigh", 0),
+    "financialCurrency": ("financialCurrency", ""),
+    "currentPrice": ("currentPrice", 0),
+    "volume": ("volume", 0),
+    "trailingPegRatio": ("trailingPegRatio", 0),
+    "bid": ("bid", 0),
+    "ask": ("ask", 0),
+    "bidSize": ("bidSize", 0),
+    "askSize": ("askSize", 0),
+    "targetHighPrice": ("targetHighPrice", 0),
+    "targetLowPrice": ("targetLowPrice", 0),
+    "targetMeanPrice": ("targetMeanPrice", 0),
+    "targetMedianPrice": ("targetMedianPrice", 0),
+    "recommendationMean": ("recommendationMean", 0),
+    "recommendationKey": ("recommendationKey", ""),
+}
+
+FINANCIAL_INFO_FIELDS: FieldSchema = {
+    "symbol": ("symbol", None),
+    "totalCash": ("totalCash", 0),
+    "totalCashPerShare": ("totalCashPerShare", 0),
+    "ebitda": ("ebitda", 0),
+    "totalDebt": ("totalDebt", 0),
+    "quickRatio": ("quickRatio", 0),
+    "currentRatio": ("currentRatio", 0),
+    "totalRevenue": ("totalRevenue", 0),
+    "debtToEquity": ("debtToEquity", 0),
+    "revenuePerShare": ("revenuePerShare", 0),
+    "returnOnAssets": ("returnOnAssets", 0),
+    "returnOnEquity": ("returnOnEquity", 0),
+    "freeCashflow": ("freeCashflow", 0),
+    "operatingCashflow": ("operatingCashflow", 0),
+    "earningsQuarterlyGrowth": ("earningsQuarterlyGrowth", 0),
+    "netIncomeToCommon": ("netIncomeToCommon", 0),
+    "trailingEps": ("trailingEps", 0),
+    "forwardEps": ("forwardEps", 0),
+    "earningsGrowth": ("earningsGrowth", 0),
+    "revenueGrowth": ("revenueGrowth", 0),
+    "grossMargins": ("grossMargins", 0),
+    "ebitdaMargins": ("ebitdaMargins", 0),
+    "operatingMargins": ("operatingMargins", 0),
+    "financialCurrency": ("financialCurrency", ""),
+}
+
+
+def project_info(info: TickerInfo, schema: FieldSchema, fields: Optional[List[str]] = None) -> dict:
+    """
+    Projects an info snapshot onto a field schema.
+
+    Args:
+        info (TickerInfo): The info snapshot.
+        schema (dict): The field schema of the tool.
+        fields (list): Only return these fields, matched case-insensitively. `symbol` is always
+            returned. Unknown names are ignored, and all fields are returned when none is known.
+
+    Returns:
+        dict: The selected fields, in schema order.
+    """
+    selected = set()
+    if fields:
+        by_name = {field.lower(): field for field in schema}
+        selected = {by_name[field.lower()] for field in fields if isinstance(field, str) and field.lower() in by_name}
+    if selected:
+        selected.add("symbol")
+
+    return {
+        field: info.get(key, default)
+        for field, (key, default) in schema.items()
+        if not selected or field in selected
+    }
@@ -0,0 +1,221 @@
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.rate_limiters import BaseRateLimiter
+from pydantic import PrivateAttr
+
+from chatbot.concurrency import AsyncSingleFlight, SingleFlight
+
+# Constants
+LLM_MAX_CONCURRENCY = 8
+LLM_MAX_RETRIES = 4
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+
+
+class TokenBucket(BaseRateLimiter):
+    """
+    Token bucket request limiter. Starts full, so a quiet model answers its first
+    `max_bucket_size` requests without waiting.
+    """
+
+    def __init__(self, requests_per_second: float, max_bucket_size: float = 1):
+        self.requests_per_second = requests_per_second
+        self.max_bucket_size = max(max_bucket_size, 1)
+        self._tokens = self.max_bucket_size
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _consume(self) -> float:
+        """
+        Takes a token, returning 0, or returns the seconds until one is available.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.max_bucket_size, self._tokens + (now - self._updated) * self.requests_per_second)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.requests_per_second
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        while True:
+            wait = self._consume()
+            if not wait:
+                return True
+            if not blocking:
+                return False
+            time.sleep(wait)
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        while True:
+            wait = self._consume()
+            if not wait:
+                return True
+            if not blocking:
+                return False
+            await asyncio.sleep(wait)
+
+
+def _retry_delay(ex: Exception, attempt: int) -> Optional[float]:
+    """
+    Returns how long to wait before retrying a rate limited request, None when `ex` is not a rate limit.
+    """
+    status = getattr(ex, "status_code", None) or getattr(ex, "code", None)
+    if status != 429:
+        return None
+    # Exponential backoff with full jitter, never shorter than what the server asked for
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+    response = getattr(ex, "response", None)
+    try:
+        delay = max(delay, float(response.headers.get("retry-after")))
+    except (AttributeError, TypeError, ValueError):
+        pass
+    return min(delay, RETRY_MAX_DELAY)
+
+
+class GatewayChatModel(BaseChatModel):
+    """
+    Wraps a chat model with the limits every caller of that model shares.
+
+    - requests are rate limited by the `rate_limiter` token bucket of the model
+    - at most `max_concurrency` requests are in flight, per sync and per async caller
+    - identical prompts already in flight are sent once and share the answer
+    - rate limited requests are retried with backoff; async callers wait on the event loop
+
+    Streams are not coalesced, and are only retried before their first chunk.
+    """
+
+    model: BaseChatModel
+    max_concurrency: int = LLM_MAX_CONCURRENCY
+    max_retries: int = LLM_MAX_RETRIES
+
+    _slots: threading.BoundedSemaphore = PrivateAttr()
+    _async_slots: asyncio.Semaphore = PrivateAttr()
+    _in_flight: SingleFlight = PrivateAttr(default_factory=SingleFlight)
+    _async_in_flight: AsyncSingleFlight = PrivateAttr(default_factory=AsyncSingleFlight)
+
+    def model_post_init(self, __context: Any):
+        super().model_post_init(__context)
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._async_slots = asyncio.Semaphore(self.max_concurrency)
+
+    @property
+    def _llm_type(self) -> str:
+        return self.model._llm_type
+
+    @property
+    def _identifying_params(self) -> dict:
+        return self.model._identifying_params
+
+    def bind_tools(self, tools, **kwargs):
+        # Let the wrapped model format the tools, then pass them through on every call
+        return self.bind(**self.model.bind_tools(tools, **kwargs).kwargs)
+
+    @staticmethod
+    def _prompt_key(messages: List[BaseMessage], stop, kwargs) -> str:
+        return json.dumps(
+            [[message.model_dump(exclude={"id"}) for message in messages], stop, kwargs], sort_keys=True, default=str
+        )
+
+    def _call(self, func, *args, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            with self._slots:
+                try:
+                    return func(*args, **kwargs)
+                except Exception as ex:
+                    delay = _retry_delay(ex, attempt)
+                    if delay is None or attempt == self.max_retries:
+                        raise
+            logging.warning(f"{self._llm_type} rate limited, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    async def _acall(self, func, *args, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            async with self._async_slots:
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as ex:
+                    delay = _retry_delay(ex, attempt)
+                    if delay is None or attempt == self.max_retries:
+                        raise
+            logging.warning(f"{self._llm_type} rate limited, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return self._in_flight.do(
+            self._prompt_key(messages, stop, kwargs),
+            self._call, self.model._generate, messages, stop=stop, run_manager=run_manager, **kwargs
+        )
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return await self._async_in_flight.do(
+            self._prompt_key(messages, stop, kwargs),
+            self._acall, self.model._agenerate, messages, stop=stop, run_manager=run_manager, **kwargs
+        )
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        for attempt in range(self.max_retries + 1):
+            started = False
+            with self._slots:
+                try:
+                    for chunk in self.model._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                        started = True
+                        yield chunk
+                    return
+                except Exception as ex:
+                    delay = _retry_delay(ex, attempt)
+                    if started or delay is None or attempt == self.max_retries:
+                        raise
+            logging.warning(f"{self._llm_type} rate limited, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        for attempt in range(self.max_retries + 1):
+            started = False
+            async with self._async_slots:
+                try:
+                    async for chunk in self.model._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                        started = True
+                        yield chunk
+                    return
+                except Exception as ex:
+                    delay = _retry_delay(ex, attempt)
+                    if started or delay is None or attempt == self.max_retries:
+                        raise
+            logging.warning(f"{self._llm_type} rate limited, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
@@ -1,30 +1,98 @@
-from langchain_google_genai import (
-    ChatGoogleGenerativeAI,
-    HarmBlockThreshold,
-    HarmCategory,
-)
-from langchain_groq import ChatGroq
 import os
+import threading
+from functools import lru_cache
 
+from chatbot.gateway import GatewayChatModel, TokenBucket
 
-GEMINI_FLASH_MODEL = ChatGoogleGenerativeAI(
-    model="gemini-1.5-flash",
-    safety_settings={
-        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-    },
-)  # Gemini 1.5 Flash does not support multi-functions return yet
+# Constants
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", 20))
 
-LLAMA_70B_MODEL = ChatGroq(
-    groq_api_key=os.environ['GROQ_API_KEY'],
-    model_name="llama3-70b-8192"
-)
+# Requests per minute and burst size, per model
+LLM_RATE_LIMITS = {
+    "gemini-1.5-flash": (15, 3),
+    "llama3-70b-8192": (30, 5),
+    "llama3-8b-8192": (30, 5),
+}
 
-LLAMA_8B_MODEL = ChatGroq(
-    groq_api_key=os.environ['GROQ_API_KEY'],
-    model_name="llama3-8b-8192"
-)
+# Role -> model, both are read as attributes of this module, e.g. `llm.SYNTHETIC_LLM`
+MODEL_ROLES = {
+    "EXTRACT_COMPANY_LLM": "LLAMA_8B_MODEL",
+    "FUNCTION_CALLING_LLM": "LLAMA_70B_MODEL",
+    "SYNTHETIC_LLM": "LLAMA_8B_MODEL",
+}
 
-EXTRACT_COMPANY_LLM = LLAMA_8B_MODEL
-FUNCTION_CALLING_LLM = LLAMA_70B_MODEL
-SYNTHETIC_LLM = LLAMA_8B_MODEL
+_MODELS = dict()
+_MODELS_LOCK = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _http_clients():
+    # One connection pool per process, shared by every Groq model
+    import httpx
+
+    limits = httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS)
+    timeout = httpx.Timeout(60, connect=5)
+    return httpx.Client(limits=limits, timeout=timeout), httpx.AsyncClient(limits=limits, timeout=timeout)
+
+
+def _rate_limiter(model_name) -> TokenBucket:
+    requests_per_minute, burst = LLM_RATE_LIMITS[model_name]
+    return TokenBucket(requests_per_second=requests_per_minute / 60, max_bucket_size=burst)
+
+
+def _groq_model(model_name) -> GatewayChatModel:
+    from langchain_groq import ChatGroq
+
+    http_client, http_async_client = _http_clients()
+    return GatewayChatModel(
+        model=ChatGroq(
+            groq_api_key=os.environ['GROQ_API_KEY'],
+            model_name=model_name,
+            http_client=http_client,
+            http_async_client=http_async_client,
+            max_retries=0,  # The gateway retries rate limits itself
+        ),
+        rate_limiter=_rate_limiter(model_name),
+    )
+
+
+def _gemini_flash_model() -> GatewayChatModel:
+    from langchain_google_genai import ChatGoogleGenerativeAI, HarmBlockThreshold, HarmCategory
+
+    return GatewayChatModel(
+        model=ChatGoogleGenerativeAI(
+            model="gemini-1.5-flash",
+            safety_settings={
+                HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+                HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+            },
+        ),
+        rate_limiter=_rate_limiter("gemini-1.5-flash"),
+    )  # Gemini 1.5 Flash does not support multi-functions return yet
+
+
+_MODEL_FACTORIES = {
+    "GEMINI_FLASH_MODEL": _gemini_flash_model,
+    "LLAMA_70B_MODEL": lambda: _groq_model("llama3-70b-8192"),
+    "LLAMA_8B_MODEL": lambda: _groq_model("llama3-8b-8192"),
+}
+
+
+def get_model(name) -> GatewayChatModel:
+    """
+    Returns a model by name or role, creating its client on first use.
+
+    Client libraries are imported and clients constructed only when a model is first
+    used, so importing the app stays cheap.
+    """
+    name = MODEL_ROLES.get(name, name)
+    with _MODELS_LOCK:
+        if name not in _MODELS:
+            _MODELS[name] = _MODEL_FACTORIES[name]()
+        return _MODELS[name]
+
+
+def __getattr__(name):
+    if name in MODEL_ROLES or name in _MODEL_FACTORIES:
+        return get_model(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,280 @@
+import bisect
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Callable, Dict
+
+# Constants
+METRICS_PREFIX = "quant"
+# Upper bounds in seconds, from an in-memory cache hit to a slow history download
+LATENCY_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+QUANTILES = [0.5, 0.95, 0.99]
+# Recent samples kept per series for the quantiles
+RESERVOIR_SIZE = 2048
+METRICS_JSONL_PATH = os.environ.get("METRICS_JSONL_PATH")
+METRICS_DUMP_INTERVAL = float(os.environ.get("METRICS_DUMP_INTERVAL", 60))
+
+
+class Histogram:
+    """
+    Latency histogram with cumulative buckets, for Prometheus, and a window of recent
+    samples for local quantiles.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS, reservoir_size=RESERVOIR_SIZE):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=reservoir_size)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def quantiles(self, quantiles=QUANTILES) -> Dict[float, float]:
+        samples = sorted(self.recent)
+        if not samples:
+            return {}
+        return {q: samples[min(len(samples) - 1, int(q * len(samples)))] for q in quantiles}
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            **{f"p{int(q * 100)}": value for q, value in self.quantiles().items()},
+        }
+
+
+class MetricsRegistry:
+    """
+    Process-local latency histograms and counters, keyed by metric name and labels.
+
+    Collectors registered with `register_collector` are called on export and return
+    counters owned elsewhere, such as the hits and misses of a cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = defaultdict(dict)  # name -> labels -> Histogram
+        self._counters = defaultdict(lambda: defaultdict(float))  # name -> labels -> value
+        self._collectors = list()
+
+    @staticmethod
+    def _labels(labels: dict) -> tuple:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def observe(self, name, value, **labels):
+        key = self._labels(labels)
+        with self._lock:
+            histogram = self._histograms[name].get(key)
+            if histogram is None:
+                histogram = self._histograms[name][key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self._counters[name][self._labels(labels)] += value
+
+    def register_collector(self, collector: Callable[[], Dict[str, Dict[str, int]]]):
+        """
+        Registers `collector()`, returning `{cache: {"hits": n, "misses": n}}`.
+        """
+        self._collectors.append(collector)
+
+    def cache_counts(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            counts = defaultdict(lambda: {"hits": 0, "misses": 0})
+            for labels, value in self._counters["cache_requests_total"].items():
+                labels = dict(labels)
+                counts[labels["cache"]][labels["result"]] += int(value)
+        for collector in self._collectors:
+            try:
+                for cache, cache_counts in collector().items():
+                    counts[cache]["hits"] += cache_counts.get("hits", 0)
+                    counts[cache]["misses"] += cache_counts.get("misses", 0)
+            except Exception as ex:
+                logging.error(f"Metrics collector failed: {ex}")
+        return dict(counts)
+
+    def snapshot(self) -> dict:
+        """
+        Returns every series with its count, sum and quantiles, and the hit ratio of every cache.
+        """
+        with self._lock:
+            latencies = [
+                {"name": name, "labels": dict(labels), **histogram.snapshot()}
+                for name, series in self._histograms.items() for labels, histogram in series.items()
+            ]
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for name, series in self._counters.items() for labels, value in series.items()
+                if name != "cache_requests_total"
+            ]
+        caches = {
+            cache: {**counts, "hit_ratio": counts["hits"] / (counts["hits"] + counts["misses"]) if counts["hits"] + counts["misses"] else None}
+            for cache, counts in self.cache_counts().items()
+        }
+        return {"timestamp": time.time(), "latencies": latencies, "counters": counters, "caches": caches}
+
+    def prometheus_text(self) -> str:
+        """
+        Renders the metrics in the Prometheus text exposition format.
+        """
+        lines = list()
+        with self._lock:
+            for name, series in self._histograms.items():
+                metric = f"{METRICS_PREFIX}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for labels, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + [float("inf")], histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{metric}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{metric}_sum{_format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{metric}_count{_format_labels(labels)} {histogram.count}")
+                quantile_metric = f"{metric[:-len('_seconds')]}_quantile_seconds"
+                lines.append(f"# TYPE {quantile_metric} gauge")
+                for labels, histogram in series.items():
+                    for q, value in histogram.quantiles().items():
+                        lines.append(f"{quantile_metric}{_format_labels(labels + (('quantile', str(q)),))} {value}")
+            for name, series in self._counters.items():
+                if name == "cache_requests_total":
+                    continue
+                lines.append(f"# TYPE {METRICS_PREFIX}_{name} counter")
+                for labels, value in series.items():
+                    lines.append(f"{METRICS_PREFIX}_{name}{_format_labels(labels)} {value}")
+
+        caches = self.cache_counts()
+        lines.append(f"# TYPE {METRICS_PREFIX}_cache_requests_total counter")
+        for cache, counts in caches.items():
+            for result in ("hits", "misses"):
+                labels = (("cache", cache), ("result", result))
+                lines.append(f"{METRICS_PREFIX}_cache_requests_total{_format_labels(labels)} {counts[result]}")
+        lines.append(f"# TYPE {METRICS_PREFIX}_cache_hit_ratio gauge")
+        for cache, counts in caches.items():
+            total = counts["hits"] + counts["misses"]
+            if total:
+                lines.append(f"{METRICS_PREFIX}_cache_hit_ratio{_format_labels((('cache', cache),))} {counts['hits'] / total}")
+        return "\n".join(lines) + "\n"
+
+    def dump_jsonl(self, path):
+        """
+        Appends the current snapshot to a JSON lines file.
+        """
+        with open(path, "a") as f:
+            f.write(json.dumps(self.snapshot(), default=str) + "\n")
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+METRICS = MetricsRegistry()
+
+
+class span:
+    """
+    Times a pipeline stage into the `stage_duration` histogram.
+
+    Works as a context manager, sync or async, and as a decorator of functions and
+    coroutine functions. Failed calls are recorded with `status="error"`.
+
+    Example:
+        with span("ticker_search"):
+            ...
+
+        @span("function_calling")
+        async def function_calling(question):
+            ...
+    """
+
+    def __init__(self, stage, **labels):
+        self.stage = stage
+        self.labels = labels
+        self._started = list()
+
+    def __enter__(self):
+        self._started.append(time.perf_counter())
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._started.pop()
+        METRICS.observe("stage_duration", elapsed, stage=self.stage, status="error" if exc_type else "ok", **self.labels)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+    def __call__(self, func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(self.stage, **self.labels):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(self.stage, **self.labels):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def observe_since(stage, started, **labels):
+    """
+    Records the time elapsed since `started`, a `time.perf_counter()` value, e.g. the time to first token.
+    """
+    METRICS.observe("stage_duration", time.perf_counter() - started, stage=stage, status="ok", **labels)
+
+
+def record_cache(cache, hit):
+    METRICS.inc("cache_requests_total", cache=cache, result="hits" if hit else "misses")
+
+
+def mount_metrics_endpoint(app, path="/metrics"):
+    """
+    Serves the Prometheus text format at `path` and the JSON snapshot at `path.json` on a FastAPI app.
+    """
+    from fastapi.responses import JSONResponse, PlainTextResponse
+    from fastapi.routing import APIRoute
+
+    routes = [
+        APIRoute(path, lambda: PlainTextResponse(METRICS.prometheus_text()), methods=["GET"]),
+        APIRoute(f"{path}.json", lambda: JSONResponse(METRICS.snapshot()), methods=["GET"]),
+    ]
+    # Ahead of any catch-all route the app has already registered
+    app.router.routes[:0] = routes
+
+
+def start_jsonl_dump(path=METRICS_JSONL_PATH, interval=METRICS_DUMP_INTERVAL):
+    """
+    Appends a snapshot to `path` every `interval` seconds, from a daemon thread. Does nothing without a path.
+    """
+    if not path:
+        return None
+
+    def dump():
+        while True:
+            time.sleep(interval)
+            try:
+                METRICS.dump_jsonl(path)
+            except OSError as ex:
+                logging.error(f"Failed to dump metrics to {path}: {ex}")
+
+    thread = threading.Thread(target=dump, name="metrics-dump", daemon=True)
+    thread.start()
+    return thread
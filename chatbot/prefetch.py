@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import os
+import re
+from typing import Optional
+
+from chatbot.concurrency import run_in_executor
+from chatbot.data import YahooFinData
+from chatbot.services import get_ticker_from_query
+
+# Constants
+PREFETCH_BUDGET = float(os.environ.get("PREFETCH_BUDGET", 10))
+PREFETCH_MAX_SYMBOLS = 5
+
+# Full histories are large, they are only warmed when the question is likely to need them
+HISTORY_HINT_PATTERN = re.compile(
+    r"histor|chart|perform|returns?\b|sharpe|sortino|cagr|calmar|drawdown|volatility|\bc?var\b|value at risk",
+    re.IGNORECASE
+)
+
+# The event loop only keeps weak references to tasks, running prefetches are held here until done
+_PREFETCH_TASKS = set()
+
+
+async def _prefetch(question):
+    symbols = [ticker.symbol for ticker in await run_in_executor(get_ticker_from_query, question)]
+    symbols = symbols[:PREFETCH_MAX_SYMBOLS]
+    if not symbols:
+        return
+
+    loads = [run_in_executor(YahooFinData.get_info, symbol) for symbol in symbols]
+    if HISTORY_HINT_PATTERN.search(question):
+        loads.append(run_in_executor(YahooFinData.get_histories, symbols))
+    await asyncio.gather(*loads, return_exceptions=True)
+    logging.info(f"Prefetched market data for {symbols}")
+
+
+async def prefetch(question, budget=PREFETCH_BUDGET):
+    """
+    Warms the ticker resolution and the market data cache for a question, speculatively.
+
+    Runs while the function calling model decides which tools to call. The tools then
+    find the data cached, or join the loads still in flight. Failures are only logged,
+    the tools fetch whatever the prefetch did not.
+
+    Args:
+        question (str): The user question.
+        budget (float): Seconds after which the prefetch gives up.
+    """
+    try:
+        await asyncio.wait_for(_prefetch(question), timeout=budget)
+    except asyncio.TimeoutError:
+        logging.info(f"Prefetch gave up after {budget}s")
+    except Exception as ex:
+        logging.warning(f"Prefetch failed: {ex}")
+
+
+def start_prefetch(question) -> Optional[asyncio.Task]:
+    """
+    Starts `prefetch` in the background. Cancel the task when its results are not needed;
+    loads already running on the pool finish into the cache, later stages are skipped.
+    """
+    if PREFETCH_BUDGET <= 0:
+        return None
+    task = asyncio.create_task(prefetch(question))
+    _PREFETCH_TASKS.add(task)
+    task.add_done_callback(_PREFETCH_TASKS.discard)
+    return task
@@ -32,3 +32,19 @@ SYNTHETIC_PROMPT = """You are a helpful assistant who answers questions based on
 - Data: {data}
 - Today: {today}
 """
+
+SYNTHETIC_CONTINUE_PROMPT = """You are a helpful assistant who extends an answer as more information arrives.
+
+**Task**: Continue the Answer so far using the New Data while adhering to the following Rules:
+
+**Rules**:
+- Only add what the New Data tells about the question, never repeat the Answer so far.
+- Continue in the same language and format, as if the Answer so far had not ended.
+- Avoid prefaces such as "based on information", "additionally, the new data shows", etc.
+
+**Details**:
+- Question: {question}
+- Answer so far: {answer}
+- New Data: {data}
+- Today: {today}
+"""
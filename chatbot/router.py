@@ -0,0 +1,108 @@
+import logging
+import re
+import uuid
+from typing import List, Optional
+
+from chatbot.services import match_symbols_from_query
+
+# (pattern, tool, fields) in order of specificity; a matched span is consumed before the next rules run,
+# so "price history" never also counts as "price"
+INTENT_RULES = [
+    (r"price (and volume )?history|historical prices?|ohlc|candlesticks?|price chart", "show_price_volume_history", None),
+    (r"performance (chart|snapshot|plot)|cumulative returns?|(returns?|drawdown) (chart|plot)", "show_stock_performance", None),
+    (r"sharpe|sortino|cagr|calmar|max(imum)? drawdown|drawdowns?|volatility|value at risk|\bc?var\b|avg (win|loss)|average (win|loss)|performance stats", "get_performance_stats", None),
+    (r"\bp/?e\b( ratio)?|price to earnings", "get_stock_trading_info", ["trailingPE", "forwardPE"]),
+    (r"market (cap|capitalization)", "get_stock_trading_info", ["marketCap"]),
+    (r"\bbeta\b", "get_stock_trading_info", ["beta"]),
+    (r"price targets?|target price|analyst (rating|recommendation)s?", "get_stock_trading_info", ["targetMeanPrice", "targetHighPrice", "targetLowPrice", "recommendationKey"]),
+    (r"\beps\b|earnings per share", "get_stock_trading_info", ["eps", "trailingEps"]),
+    (r"\bvolume\b", "get_stock_trading_info", ["volume", "regularMarketVolume"]),
+    (r"\b(stock |share |current |last )?(price|quote|trading at)\b", "get_stock_trading_info", ["currentPrice", "regularMarketPrice", "previousClose", "currency"]),
+    (r"\b((total )?revenue|sales)\b", "get_financial_info", ["totalRevenue", "revenueGrowth", "revenuePerShare"]),
+    (r"\bdebt\b|leverage|debt to equity", "get_financial_info", ["totalDebt", "debtToEquity"]),
+    (r"cash ?flow", "get_financial_info", ["freeCashflow", "operatingCashflow"]),
+    (r"\bebitda\b", "get_financial_info", ["ebitda", "ebitdaMargins"]),
+    (r"margins?", "get_financial_info", ["grossMargins", "operatingMargins", "ebitdaMargins"]),
+    (r"\broe\b|return on equity|\broa\b|return on assets", "get_financial_info", ["returnOnEquity", "returnOnAssets"]),
+    (r"\bceo\b|executives?|officers?|management", "get_company_info", ["longName", "companyOfficers"]),
+    (r"\bsector\b|\bindustry\b", "get_company_info", ["longName", "sector", "industry"]),
+    (r"headquarter(s|ed)?|address|located", "get_company_info", ["longName", "address", "city", "state", "country"]),
+    (r"\bwebsite\b", "get_company_info", ["longName", "website"]),
+    (r"employees|headcount", "get_company_info", ["longName", "fullTimeEmployees"]),
+]
+_COMPILED_RULES = [(re.compile(pattern, re.IGNORECASE), tool, fields) for pattern, tool, fields in INTENT_RULES]
+
+# Questions asking for judgement or anything the tools cannot answer go to the function calling model
+DEFER_PATTERN = re.compile(
+    r"\b(why|should|compare|comparison|versus|vs|better|worse|predict|forecast|news|explain|recommend|portfolio|if)\b",
+    re.IGNORECASE
+)
+
+PERIOD_PATTERNS = [
+    (r"\bytd\b|year to date", "ytd"),
+    (r"\bmax\b|all[- ]time|since (ipo|inception)", "max"),
+    (r"\b10 ?(y|yr|years?)\b|decade", "10y"),
+    (r"\b5 ?(y|yr|years?)\b", "5y"),
+    (r"\b2 ?(y|yr|years?)\b", "2y"),
+    (r"\b(1 ?(y|yr|year)|one year|12 months|past year|last year)\b", "1y"),
+    (r"\b6 ?(mo|months?)\b|half a year", "6mo"),
+    (r"\b3 ?(mo|months?)\b|quarter", "3mo"),
+    (r"\b1 ?(mo|month)\b|one month|past month|last month", "1mo"),
+    (r"\b5 ?(d|days?)\b|week", "5d"),
+    (r"\b1 ?(d|day)\b|today|intraday", "1d"),
+]
+
+
+def _extract_period(question) -> Optional[str]:
+    for pattern, period in PERIOD_PATTERNS:
+        if re.search(pattern, question, re.IGNORECASE):
+            return period
+    return None
+
+
+def route_question(question, follow_up=False) -> Optional[List[dict]]:
+    """
+    Maps an obvious question straight to tool calls, without the function calling model.
+
+    A question is routed only when its tickers or company names are matched locally, or it
+    is a follow-up about the companies of the previous turns, at least one intent rule
+    matches and nothing in it calls for judgement.
+
+    Args:
+        question (str): The user question.
+        follow_up (bool): Whether the question refers to the tickers of the previous turns.
+
+    Returns:
+        list: Tool calls in the `AIMessage.tool_calls` format, or None when the function
+        calling model has to decide.
+    """
+    if DEFER_PATTERN.search(question) or not (follow_up or match_symbols_from_query(question)):
+        return None
+
+    text = question
+    fields_by_tool = dict()
+    for pattern, tool, fields in _COMPILED_RULES:
+        if pattern.search(text) is None:
+            continue
+        text = pattern.sub(" ", text)
+        tool_fields = fields_by_tool.setdefault(tool, [])
+        for field in fields or []:
+            if field not in tool_fields:
+                tool_fields.append(field)
+
+    if not fields_by_tool:
+        return None
+
+    tool_calls = list()
+    for tool, fields in fields_by_tool.items():
+        args = {"question": question}
+        if fields:
+            args["fields"] = fields
+        if tool == "show_price_volume_history":
+            period = _extract_period(question)
+            if period:
+                args["period"] = period
+        tool_calls.append({"name": tool, "args": args, "id": f"route_{uuid.uuid4().hex[:12]}", "type": "tool_call"})
+
+    logging.info(f"Routed without the function calling model: {tool_calls}")
+    return tool_calls
@@ -0,0 +1,124 @@
+import json
+import math
+from datetime import date, datetime
+from typing import List
+
+import numpy as np
+
+from chatbot.fields import COMPANY_INFO_FIELDS, FINANCIAL_INFO_FIELDS, TRADING_INFO_FIELDS
+
+# Constants
+TOOL_RESULT_TOKEN_BUDGET = 400
+CHARS_PER_TOKEN = 4  # Rough size of a token in the compact JSON, good enough to budget with
+LONG_TEXT_CHARS = 500
+MAX_OFFICERS = 5
+SIGNIFICANT_DIGITS = 6
+
+# Dropped first, in this order, when a result is over its budget. The n x n matrices of
+# `compare_assets` go before its per-symbol summaries
+LOW_PRIORITY_FIELDS = [
+    "companyOfficers", "longBusinessSummary", "address", "zip", "phone", "city", "state", "priceHint",
+    "bidSize", "askSize", "trailingPegRatio", "financialCurrency", "timezone", "quoteType",
+    "annualized_covariance", "correlation",
+]
+
+# Placeholders the info tools fill in for keys Yahoo did not return, see `chatbot.fields.project_info`
+_FIELD_DEFAULTS = {
+    field: default
+    for schema in (COMPANY_INFO_FIELDS, TRADING_INFO_FIELDS, FINANCIAL_INFO_FIELDS)
+    for field, (_, default) in schema.items()
+}
+
+_EMPTY = object()
+
+
+def compact_value(value):
+    """
+    Converts a tool value to its compact JSON form. Empty values and non-finite numbers
+    are returned as `_EMPTY` so the caller can drop them, zeros are kept.
+    """
+    if isinstance(value, (np.integer, np.floating, np.bool_)):
+        value = value.item()
+    if value is None:
+        return _EMPTY
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            return _EMPTY
+        compact = float(f"{value:.{SIGNIFICANT_DIGITS}g}")
+        return int(compact) if compact.is_integer() and abs(compact) < 1e15 else compact
+    if isinstance(value, (datetime, date)):
+        return value.strftime("%Y-%m-%d")
+    if isinstance(value, str):
+        value = value.strip()
+        if not value:
+            return _EMPTY
+        return value if len(value) <= LONG_TEXT_CHARS else value[:LONG_TEXT_CHARS].rsplit(" ", 1)[0] + "..."
+    if isinstance(value, dict):
+        compact = {key: compact_value(item) for key, item in value.items()}
+        compact = {key: item for key, item in compact.items() if item is not _EMPTY}
+        return compact or _EMPTY
+    if isinstance(value, (list, tuple)):
+        compact = [item for item in (compact_value(item) for item in value) if item is not _EMPTY]
+        return compact or _EMPTY
+    return str(value)
+
+
+def _compact_officers(officers):
+    # Names and titles are what questions ask about, pay and birth years are noise
+    return [
+        {key: officer.get(key) for key in ("name", "title") if officer.get(key)}
+        for officer in officers[:MAX_OFFICERS] if isinstance(officer, dict)
+    ]
+
+
+def _is_field_default(field, value) -> bool:
+    return field in _FIELD_DEFAULTS and isinstance(value, (int, float, str, list)) and value == _FIELD_DEFAULTS[field]
+
+
+def serialize_result(result: dict, budget_tokens=TOOL_RESULT_TOKEN_BUDGET) -> str:
+    """
+    Serializes one tool result to compact JSON within a token budget.
+
+    Empty fields, and info fields still at their schema default, are dropped. When the result is still over budget, the
+    low priority fields go first, then the remaining fields from the last one up, so the
+    leading fields such as `symbol` are always kept.
+
+    Args:
+        result (dict): The tool result.
+        budget_tokens (int): The token budget of the result.
+
+    Returns:
+        str: The compact JSON object.
+    """
+    result = {field: value for field, value in result.items() if not _is_field_default(field, value)}
+    if isinstance(result.get("companyOfficers"), list):
+        result = {**result, "companyOfficers": _compact_officers(result["companyOfficers"])}
+    data = compact_value(result)
+    if data is _EMPTY:
+        return "{}"
+
+    budget_chars = budget_tokens * CHARS_PER_TOKEN
+    text = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+    drop_order = [key for key in LOW_PRIORITY_FIELDS if key in data] + [key for key in reversed(data) if key not in LOW_PRIORITY_FIELDS]
+    while len(text) > budget_chars and len(data) > 1 and drop_order:
+        data.pop(drop_order.pop(0), None)
+        text = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+    return text
+
+
+def serialize_tool_results(results: List[dict], budget_tokens=TOOL_RESULT_TOKEN_BUDGET) -> str:
+    """
+    Serializes tool results for the synthesis prompt, one compact JSON object per line.
+
+    Args:
+        results (list): The tool results.
+        budget_tokens (int): The token budget of each result.
+
+    Returns:
+        str: The serialized results.
+    """
+    return "\n".join(serialize_result(result, budget_tokens) for result in results)
@@ -1,21 +1,40 @@
+import contextvars
+import json
 import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from functools import lru_cache
-from typing import List, Optional
+from typing import Iterator, List, Optional
 
-import plotly
 import requests
-import re
+from cachetools import LRUCache
 
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import PromptTemplate
 from langchain_core.runnables import RunnablePassthrough
 
-from chatbot.llm import EXTRACT_COMPANY_LLM
+from chatbot.concurrency import SingleFlight
+from chatbot import llm
+from chatbot.metrics import METRICS, record_cache, span
 from chatbot.prompt import EXTRACT_COMPANY_NAME_PROMPT
+from chatbot.symbols import extract_symbols, get_symbol_index, has_proper_noun
 
 # Constants
 DEFAULT_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36'
 YAHOO_FIN_SEARCH_BASE = "https://query2.finance.yahoo.com/v1/finance/search"
+YAHOO_FIN_SEARCH_TIMEOUT = 5
+
+# Reused across searches so misses on the local index keep their connections alive
+_SEARCH_SESSION = requests.Session()
+_SEARCH_SESSION.headers.update({'User-Agent': DEFAULT_USER_AGENT, "content-type": "application/json"})
+
+_IN_FLIGHT = SingleFlight()
+_EXTRACTED_COMPANIES = LRUCache(maxsize=2048)
+_EXTRACTED_COMPANIES_LOCK = threading.Lock()
+# Separate from the tool pool, tool threads block on these lookups
+_LOOKUP_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ticker-lookup")
+_RESOLUTION_CONTEXT = contextvars.ContextVar("resolution_context", default=None)
 
 
 class CompanyTicker:
@@ -29,6 +48,137 @@ class CompanyTicker:
         return f"CompanyTicker(symbol={self.symbol}, short_name={self.short_name}, long_name={self.long_name}, exchange={self.exchange})"
 
 
+class ResolutionContext:
+    """
+    Per-message ticker resolution state, shared by every tool called during the turn.
+
+    Each key is resolved once; concurrent callers asking for a key that is still being
+    resolved wait for that call instead of starting their own. `session` is the state of the
+    chat session across messages, see `chatbot.session.SessionContext`.
+    """
+
+    def __init__(self, session=None):
+        self._lock = threading.Lock()
+        self._results = {}
+        self.session = session
+
+    def resolve(self, key, func, *args):
+        with self._lock:
+            future = self._results.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._results[key] = future
+
+        if not owner:
+            return future.result()
+
+        try:
+            result = func(*args)
+        except BaseException as ex:
+            # Forget the failure so a later tool in the turn can retry
+            with self._lock:
+                self._results.pop(key, None)
+            future.set_exception(ex)
+            raise
+
+        future.set_result(result)
+        return result
+
+    def resolved_symbols(self) -> List[str]:
+        """
+        Returns the symbols of every query resolved so far in the turn.
+        """
+        with self._lock:
+            futures = [future for key, future in self._results.items() if key[0] == "query"]
+        symbols = dict()
+        for future in futures:
+            if future.done() and future.exception() is None:
+                symbols.update((ticker.symbol, None) for ticker in future.result())
+        return list(symbols)
+
+
+@contextmanager
+def resolution_context(session=None):
+    """
+    Opens a resolution context for the current message. Tools running inside it,
+    including those on the tool thread pool, share resolved tickers. With a `session`,
+    questions naming no company resolve to the tickers of the previous turns.
+    """
+    token = _RESOLUTION_CONTEXT.set(ResolutionContext(session))
+    try:
+        yield _RESOLUTION_CONTEXT.get()
+    finally:
+        _RESOLUTION_CONTEXT.reset(token)
+
+
+def current_session():
+    """
+    Returns the session state of the active resolution context, or None.
+    """
+    context = _RESOLUTION_CONTEXT.get()
+    return context.session if context is not None else None
+
+
+def _resolve(key, func, *args):
+    """
+    Resolves `key` through the active resolution context, or only de-duplicates
+    in-flight calls when there is no context.
+    """
+    context = _RESOLUTION_CONTEXT.get()
+    if context is None:
+        return _IN_FLIGHT.do(key, func, *args)
+    return context.resolve(key, _IN_FLIGHT.do, key, func, *args)
+
+
+class _CompanyListParser:
+    """
+    Incremental parser for the list of company names produced by the extraction chain.
+
+    Accepts JSON or Python list syntax and returns each name as soon as its closing
+    quote arrives, so lookups can start while the model is still streaming.
+    """
+
+    def __init__(self):
+        self._in_list = False
+        self._quote = None
+        self._escape = False
+        self._buffer = []
+
+    def feed(self, chunk) -> List[str]:
+        names = []
+        for char in chunk:
+            if self._quote is not None:
+                if self._escape:
+                    self._escape = False
+                    self._buffer.append(char)
+                elif char == "\\":
+                    self._escape = True
+                    self._buffer.append(char)
+                elif char == self._quote:
+                    name = self._decode("".join(self._buffer)).strip()
+                    if name:
+                        names.append(name)
+                    self._buffer = []
+                    self._quote = None
+                else:
+                    self._buffer.append(char)
+            elif char == "[":
+                self._in_list = True
+            elif char == "]":
+                self._in_list = False
+            elif self._in_list and char in "\"'":
+                self._quote = char
+        return names
+
+    @staticmethod
+    def _decode(raw) -> str:
+        try:
+            return json.loads(f'"{raw}"')
+        except ValueError:
+            return raw.replace("\\'", "'")
+
+
 def _extract_companies_from_text(text):
     """
     Extracts company names from a given text query.
@@ -39,44 +189,59 @@ def _extract_companies_from_text(text):
     Returns:
         list: A list of unique company names extracted from the query.
     """
-    pattern = r'\[.*?\]'  # Regular expression pattern to match a Python list
-    companies = []
-
-    for match in re.findall(pattern, text):
-        try:
-            extracted_list = eval(match)  # Evaluate the match as Python code
-            if isinstance(extracted_list, list):
-                companies.extend(extracted_list)
-        except SyntaxError:
-            logging.warning(f"Failed to evaluate list: {match}")
-
-    return list(set(companies))  # Return unique company names
+    return list(dict.fromkeys(_CompanyListParser().feed(text)))
 
 
-@lru_cache(maxsize=2048)
-def _extract_company_from_query(query):
+def _iter_companies_from_query(query) -> Iterator[str]:
     """
-    Invokes an external chain to extract company information from the query.
+    Yields the unique companies mentioned in the query as soon as each one is known.
+
+    Known tickers and company names are matched locally first; the extraction chain
+    is only invoked when nothing is matched with confidence, and its output is parsed
+    while it streams.
 
     Args:
         query (str): The text query.
 
     Returns:
-        list: A list of unique company names extracted from the query.
+        Iterator[str]: Company names or symbols extracted from the query.
     """
+    with _EXTRACTED_COMPANIES_LOCK:
+        cached = _EXTRACTED_COMPANIES.get(query)
+    record_cache("extracted_companies", hit=cached is not None)
+    if cached is not None:
+        yield from cached
+        return
+
+    symbols = match_symbols_from_query(query)
+    if symbols:
+        logging.info(f"Matched {symbols} without the extraction LLM")
+        with _EXTRACTED_COMPANIES_LOCK:
+            _EXTRACTED_COMPANIES[query] = symbols
+        yield from symbols
+        return
+
     chain = (
         {"question": RunnablePassthrough()}
         | PromptTemplate(
             template=EXTRACT_COMPANY_NAME_PROMPT,
             input_variables=["question"],
         )
-        | EXTRACT_COMPANY_LLM
+        | llm.EXTRACT_COMPANY_LLM
         | StrOutputParser()
     )
 
-    result = chain.invoke(query)
-    companies = _extract_companies_from_text(result)
-    return companies
+    parser = _CompanyListParser()
+    companies = []
+    with span("extract_companies_llm"):
+        for chunk in chain.stream(query):
+            for name in parser.feed(chunk):
+                if name not in companies:
+                    companies.append(name)
+                    yield name
+
+    with _EXTRACTED_COMPANIES_LOCK:
+        _EXTRACTED_COMPANIES[query] = companies
 
 
 @lru_cache(maxsize=2048)
@@ -84,19 +249,41 @@ def _get_ticker_from_name(name) -> Optional[CompanyTicker]:
     """
     Fetches the ticker information for a given company name.
 
+    The local symbol index is tried first, Yahoo search is only used for names it does not know.
+
+    Args:
+        name (str): The name of the company.
+
+    Returns:
+        CompanyTicker: The ticker information, or None when the name cannot be resolved.
+    """
+    index = get_symbol_index()
+    record = index.lookup(name) if index is not None else None
+    if record is not None:
+        return CompanyTicker(
+            symbol=record.symbol,
+            short_name=record.short_name,
+            long_name=record.long_name,
+            exchange=record.exchange,
+        )
+
+    return _search_ticker_from_name(name)
+
+
+@span("ticker_search")
+def _search_ticker_from_name(name) -> Optional[CompanyTicker]:
+    """
+    Searches Yahoo Finance for the ticker of a given company name.
+
     Args:
         name (str): The name of the company.
 
     Returns:
-        dict: A dictionary containing the ticker information.
+        CompanyTicker: The first quote returned by the search, or None on failure.
     """
     params = {"q": name}
     try:
-        response = requests.get(
-            YAHOO_FIN_SEARCH_BASE,
-            params=params,
-            headers={'User-Agent': DEFAULT_USER_AGENT, "content-type": "application/json"}
-        )
+        response = _SEARCH_SESSION.get(YAHOO_FIN_SEARCH_BASE, params=params, timeout=YAHOO_FIN_SEARCH_TIMEOUT)
         response.raise_for_status()
         data = response.json()
         record = data['quotes'][0]
@@ -111,6 +298,20 @@ def _get_ticker_from_name(name) -> Optional[CompanyTicker]:
         return None
 
 
+def match_symbols_from_query(query) -> List[str]:
+    """
+    Matches the tickers and known company names of a query against the local symbol index only.
+
+    Args:
+        query (str): The text query.
+
+    Returns:
+        list: The matched symbols, empty when the query needs the extraction LLM.
+    """
+    index = get_symbol_index()
+    return extract_symbols(query, index) if index is not None else []
+
+
 def get_ticker_from_query(query) -> List[CompanyTicker]:
     """
     Processes a query to extract company names and fetch their ticker information.
@@ -127,24 +328,48 @@ def get_ticker_from_query(query) -> List[CompanyTicker]:
         {'symbol': 'MSFT', 'short_name': 'Microsoft Corporation', 'long_name': 'Microsoft Corporation', 'exchange': 'NMS'}
     ]
     """
-    companies = _extract_company_from_query(query)
+    session = current_session()
+    follow_up = session is not None and session.is_follow_up(query)
+    if follow_up and not has_proper_noun(query) and not match_symbols_from_query(query):
+        # "and its Sharpe ratio?" is about the previous companies, no need to ask the extractor
+        logging.info(f"Resolved follow-up to {session.last_tickers}")
+        return session.last_tickers
+
+    tickers = _resolve(("query", query), _get_ticker_from_query, query)
+    if session is not None:
+        if tickers:
+            session.remember_tickers(tickers)
+        elif follow_up:
+            tickers = session.last_tickers
+            logging.info(f"Resolved follow-up to {tickers}")
+    return tickers
+
+
+@span("resolve_tickers")
+def _get_ticker_from_query(query) -> List[CompanyTicker]:
+    # Each name is looked up as soon as the extractor yields it, overlapping with the rest of the stream
+    lookups = [
+        _LOOKUP_EXECUTOR.submit(
+            contextvars.copy_context().run, _resolve, ("name", company_name), _get_ticker_from_name, company_name
+        )
+        for company_name in _iter_companies_from_query(query)
+    ]
     results = []
 
-    for company_name in companies:
-        result = _get_ticker_from_name(company_name)
+    for lookup in lookups:
+        result = lookup.result()
         if result:
             results.append(result)
 
     return results
 
 
-def to_plotly(fig):
-    try:
-        return plotly.tools.mpl_to_plotly(fig)
-    except Exception as ex:
-        logging.error(f"Failed to convert to plotly: {ex}")
-        return None
+def _name_lookup_counts() -> dict:
+    info = _get_ticker_from_name.cache_info()
+    return {"ticker_name": {"hits": info.hits, "misses": info.misses}}
+
 
+METRICS.register_collector(_name_lookup_counts)
 
 # Example usage
 if __name__ == "__main__":
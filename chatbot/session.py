@@ -0,0 +1,76 @@
+import json
+import re
+import threading
+from typing import List, Optional
+
+from cachetools import TTLCache
+
+from chatbot.data import YahooFinData
+from chatbot.metrics import record_cache
+
+# Constants
+SESSION_PAYLOAD_TTL = 120
+SESSION_PAYLOAD_SIZE = 256
+# Questions pointing back at the companies of the previous turns
+FOLLOW_UP_PATTERN = re.compile(
+    r"\b(it|its|it's|they|them|their|theirs|those|these|both|each|same|(this|that|the) (stock|company|one|ticker)s?)\b",
+    re.IGNORECASE
+)
+
+
+class SessionContext:
+    """
+    Conversation state of one chat session, kept across its messages.
+
+    Remembers the tickers resolved last, so a follow-up such as "and its Sharpe ratio?",
+    where extraction finds no company, is answered for the same companies, and the
+    per-ticker tool results of the recent turns, so asking again does not fetch or compute
+    them again. Results expire after `ttl` seconds, the least recently used go first when
+    more than `maxsize` are kept, and a result is dropped as soon as fresh market data is
+    loaded for its symbol.
+    """
+
+    def __init__(self, ttl=SESSION_PAYLOAD_TTL, maxsize=SESSION_PAYLOAD_SIZE):
+        self._lock = threading.Lock()
+        self._tickers = []
+        self._payloads = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    @property
+    def last_tickers(self) -> List:
+        with self._lock:
+            return list(self._tickers)
+
+    def remember_tickers(self, tickers: List):
+        with self._lock:
+            self._tickers = list(tickers)
+
+    def is_follow_up(self, question) -> bool:
+        """
+        Tells whether the question refers back to the tickers of the previous turns.
+        """
+        return bool(self.last_tickers) and FOLLOW_UP_PATTERN.search(question) is not None
+
+    @staticmethod
+    def _payload_key(tool_name, symbol, args: dict) -> tuple:
+        return tool_name, symbol, json.dumps(args, sort_keys=True, default=str)
+
+    def get_payload(self, tool_name, symbol, args: dict) -> Optional[dict]:
+        """
+        Returns a copy of the result a per-ticker tool handler gave for the same arguments, or None.
+        """
+        key = self._payload_key(tool_name, symbol, args)
+        with self._lock:
+            cached = self._payloads.get(key)
+        hit = cached is not None and cached[0] == YahooFinData.data_version([symbol])
+        record_cache("session_payload", hit)
+        # The caller pops the figure off the result, the cached one keeps it
+        return dict(cached[1]) if hit else None
+
+    def put_payload(self, tool_name, symbol, args: dict, payload: dict):
+        key = self._payload_key(tool_name, symbol, args)
+        version = YahooFinData.data_version([symbol])
+        with self._lock:
+            self._payloads[key] = (version, dict(payload))
+
+    def __repr__(self):
+        return f"SessionContext(tickers={[ticker.symbol for ticker in self.last_tickers]}, payloads={len(self._payloads)})"
@@ -0,0 +1,60 @@
+import subprocess
+import sys
+from collections import defaultdict
+from typing import List, NamedTuple
+
+# Constants
+DEFAULT_MODULES = ["main"]
+TOP_MODULES = 25
+
+
+class ImportTime(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+
+
+def measure_imports(modules: List[str]) -> List[ImportTime]:
+    """
+    Imports `modules` in a fresh interpreter under `-X importtime` and returns the cost of
+    every module it loaded, in microseconds.
+    """
+    statement = "; ".join(f"import {module}" for module in modules)
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement], capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {modules} failed:\n{completed.stderr.strip().splitlines()[-1]}")
+
+    times = list()
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        times.append(ImportTime(module.strip(), int(self_us), int(cumulative_us)))
+    return times
+
+
+def report(modules: List[str], top=TOP_MODULES) -> str:
+    """
+    Formats the import cost of `modules`: the total, the cost per top level package and
+    the most expensive modules including what they import.
+    """
+    times = measure_imports(modules)
+    packages = defaultdict(int)
+    for entry in times:
+        packages[entry.module.split(".")[0]] += entry.self_us
+    total = sum(packages.values())
+
+    lines = [f"Importing {', '.join(modules)}: {total / 1000:.0f} ms, {len(times)} modules", "", "By package (self time):"]
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        lines.append(f"  {self_us / 1000:8.1f} ms  {100 * self_us / total:5.1f}%  {package}")
+    lines += ["", "By module (cumulative time):"]
+    for entry in sorted(times, key=lambda entry: -entry.cumulative_us)[:top]:
+        lines.append(f"  {entry.cumulative_us / 1000:8.1f} ms  {entry.module}")
+    return "\n".join(lines)
+
+
+# Usage: python -m chatbot.startup [module ...]
+if __name__ == "__main__":
+    print(report(sys.argv[1:] or DEFAULT_MODULES))
@@ -0,0 +1,238 @@
+from statistics import NormalDist
+from typing import Dict, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from chatbot.metrics import span
+
+# Constants
+PERIODS_PER_YEAR = 252
+VAR_CONFIDENCE = 0.95
+ROLLING_WINDOW = 63  # About three months of trading days
+# Pandas period of each rebalance schedule, "none" buys and holds
+REBALANCE_PERIODS = {"daily": "D", "weekly": "W", "monthly": "M", "quarterly": "Q", "yearly": "Y"}
+
+PERFORMANCE_METRICS = [
+    "cagr", "sharpe", "max_drawdown", "sortino", "avg_win", "avg_loss", "volatility", "calmar", "value_at_risk", "cvar"
+]
+
+
+def returns_matrix(returns: Dict[str, pd.Series]) -> pd.DataFrame:
+    """
+    Aligns per-symbol daily returns on their dates. Dates a symbol has no bar for are NaN.
+    """
+    if not returns:
+        return pd.DataFrame(dtype=float)
+    return pd.concat(returns, axis=1).sort_index()
+
+
+@span("performance_stats")
+def performance_stats(returns: pd.DataFrame, periods=PERIODS_PER_YEAR, confidence=VAR_CONFIDENCE) -> pd.DataFrame:
+    """
+    Computes the performance metrics of every column of a returns matrix in one pass.
+
+    Matches the defaults of the `qs.stats` functions of the same names. NaN cells, dates a
+    symbol did not trade, are left out of every statistic, so each column gets the same
+    result as its own series would.
+
+    Args:
+        returns (DataFrame): Daily returns, dates x symbols.
+        periods (int): Periods per year used to annualize.
+        confidence (float): Confidence of the parametric value at risk and cvar.
+
+    Returns:
+        DataFrame: One row per symbol, one column per metric in `PERFORMANCE_METRICS`.
+    """
+    r = returns.to_numpy(dtype=float)
+    observed = ~np.isnan(r)
+    filled = np.where(observed, r, 0.0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        n = observed.sum(axis=0)
+        mean = filled.sum(axis=0) / n
+        std = np.sqrt((np.where(observed, r - mean, 0.0) ** 2).sum(axis=0) / (n - 1))
+
+        # Compounded growth, shared by cagr and the drawdown curve
+        wealth = np.cumprod(1.0 + filled, axis=0)
+        total = wealth[-1] if len(wealth) else np.full(r.shape[1], np.nan)
+        cagr = np.where(total < 0, np.nan, np.abs(total) ** (periods / n) - 1)
+
+        # Drawdowns are measured from the running peak, starting from the initial equity of 1
+        peak = np.maximum(np.maximum.accumulate(wealth, axis=0), 1.0)
+        max_drawdown = (wealth / peak).min(axis=0) - 1 if len(wealth) else np.zeros(r.shape[1])
+
+        negative = filled < 0
+        positive = filled > 0
+        downside = np.sqrt((filled ** 2 * negative).sum(axis=0) / n)
+        sortino = np.where(downside == 0, np.nan, mean / downside) * np.sqrt(periods)
+        avg_win = (filled * positive).sum(axis=0) / positive.sum(axis=0)
+        avg_loss = (filled * negative).sum(axis=0) / negative.sum(axis=0)
+
+        # Parametric (normal) value at risk and expected shortfall
+        alpha = 1 - confidence
+        z = NormalDist().inv_cdf(alpha)
+        value_at_risk = mean + std * z
+        cvar = mean - std * NormalDist().pdf(z) / alpha
+
+        stats = {
+            "cagr": cagr,
+            "sharpe": mean / std * np.sqrt(periods),
+            "max_drawdown": max_drawdown,
+            "sortino": sortino,
+            "avg_win": avg_win,
+            "avg_loss": avg_loss,
+            "volatility": std * np.sqrt(periods),
+            "calmar": cagr / np.abs(max_drawdown),
+            "value_at_risk": value_at_risk,
+            "cvar": cvar,
+        }
+
+    return pd.DataFrame(stats, index=returns.columns, columns=PERFORMANCE_METRICS)
+
+
+class Comparison(NamedTuple):
+    correlation: pd.DataFrame
+    covariance: pd.DataFrame  # Annualized
+    beta: pd.Series
+    total_return: pd.Series
+    relative_return: pd.Series  # Total return minus the benchmark total return
+    cumulative: pd.DataFrame
+    rolling_sharpe: pd.DataFrame
+
+
+def compare_returns(returns: pd.DataFrame, benchmark, window=ROLLING_WINDOW, periods=PERIODS_PER_YEAR) -> Comparison:
+    """
+    Compares the columns of a returns matrix with each other and with a benchmark column.
+
+    Rows with a missing value are dropped first, so every statistic is computed over the
+    same dates. Every statistic is a vectorized pass over the whole matrix, rolling windows
+    included.
+
+    Args:
+        returns (DataFrame): Daily returns, dates x symbols, including `benchmark`.
+        benchmark (str): The benchmark column of the betas and relative returns.
+        window (int): Length of the rolling Sharpe window, in periods.
+        periods (int): Periods per year used to annualize.
+
+    Returns:
+        Comparison: The comparison statistics, rows and columns labelled by symbol.
+    """
+    aligned = returns.dropna()
+    symbols = aligned.columns
+    r = aligned.to_numpy(dtype=float)
+    b = symbols.get_loc(benchmark)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        covariance = np.atleast_2d(np.cov(r, rowvar=False))
+        std = np.sqrt(np.diag(covariance))
+        correlation = covariance / np.outer(std, std)
+        beta = covariance[:, b] / covariance[b, b]
+
+        wealth = np.cumprod(1.0 + r, axis=0)
+        total_return = wealth[-1] - 1 if len(wealth) else np.full(len(symbols), np.nan)
+
+        # Rolling mean and standard deviation from running sums, one pass for every column
+        sums = np.vstack([np.zeros((1, r.shape[1])), np.cumsum(r, axis=0)])
+        squares = np.vstack([np.zeros((1, r.shape[1])), np.cumsum(r ** 2, axis=0)])
+        window_sum = sums[window:] - sums[:-window]
+        window_mean = window_sum / window
+        window_var = np.maximum((squares[window:] - squares[:-window]) - window_sum * window_mean, 0) / (window - 1)
+        rolling_sharpe = window_mean / np.sqrt(window_var) * np.sqrt(periods)
+
+    return Comparison(
+        correlation=pd.DataFrame(correlation, index=symbols, columns=symbols),
+        covariance=pd.DataFrame(covariance * periods, index=symbols, columns=symbols),
+        beta=pd.Series(beta, index=symbols),
+        total_return=pd.Series(total_return, index=symbols),
+        relative_return=pd.Series(total_return - total_return[b], index=symbols),
+        cumulative=pd.DataFrame(wealth - 1, index=aligned.index, columns=symbols),
+        rolling_sharpe=pd.DataFrame(rolling_sharpe, index=aligned.index[window - 1:], columns=symbols),
+    )
+
+
+class Backtest(NamedTuple):
+    returns: pd.Series  # Daily portfolio returns
+    turnover: float  # Annualized one-way turnover, 1.0 trades the whole portfolio once a year
+    rebalances: int
+
+
+def _rebalance_groups(dates: pd.DatetimeIndex, rebalance) -> np.ndarray:
+    # Consecutive rows of the same rebalance period share a group number, starting from 0
+    if rebalance == "none":
+        return np.zeros(len(dates), dtype=int)
+    if rebalance not in REBALANCE_PERIODS:
+        raise ValueError(f"Unknown rebalance schedule {rebalance}, expected none or one of {', '.join(REBALANCE_PERIODS)}")
+    codes = dates.to_period(REBALANCE_PERIODS[rebalance]).asi8
+    return np.concatenate([[0], np.cumsum(codes[1:] != codes[:-1])]) if len(codes) else np.zeros(0, dtype=int)
+
+
+@span("backtest")
+def backtest_portfolio(returns: pd.DataFrame, weights: pd.Series, rebalance="monthly", periods=PERIODS_PER_YEAR) -> Backtest:
+    """
+    Backtests a portfolio rebalanced to fixed weights at the start of every rebalance period.
+
+    Between two rebalances every holding compounds on its own, so the portfolio value is the
+    weighted sum of the holdings' growth since the last rebalance. The growth is taken from
+    cumulative log returns restarted per period, one vectorized pass over the whole matrix.
+
+    Args:
+        returns (DataFrame): Daily returns, dates x symbols. Rows with a missing value are dropped.
+        weights (Series): Target weight per symbol, normalized to sum to 1.
+        rebalance (str): "none", "daily", "weekly", "monthly", "quarterly" or "yearly".
+        periods (int): Periods per year used to annualize the turnover.
+
+    Returns:
+        Backtest: The portfolio returns, the annualized turnover and the number of rebalances.
+    """
+    aligned = returns[weights.index].dropna()
+    w = weights.to_numpy(dtype=float)
+    w = w / w.sum()
+    r = aligned.to_numpy(dtype=float)
+    if len(r) == 0:
+        return Backtest(returns=pd.Series(dtype=float, name="portfolio"), turnover=0.0, rebalances=0)
+
+    groups = _rebalance_groups(aligned.index, rebalance)
+    starts = np.flatnonzero(np.diff(groups, prepend=-1))
+
+    # Growth of each holding since its period started, running log sums restarted per period
+    log_growth = np.cumsum(np.log1p(r), axis=0)
+    offsets = np.vstack([np.zeros((1, r.shape[1])), log_growth[starts[1:] - 1]])
+    growth = np.exp(log_growth - offsets[groups])
+
+    # Portfolio value relative to the last rebalance, 1 just before each period starts
+    value = growth @ w
+    previous = np.concatenate([[1.0], value[:-1]])
+    previous[starts] = 1.0
+    portfolio = value / previous - 1
+
+    # Drifted weights on the last day of each period, traded back to the targets
+    ends = starts[1:] - 1
+    drifted = growth[ends] * w / value[ends, None]
+    traded = 0.5 * np.abs(drifted - w).sum()
+    years = len(r) / periods
+
+    return Backtest(
+        returns=pd.Series(portfolio, index=aligned.index, name="portfolio"),
+        turnover=float(traded / years),
+        rebalances=len(ends),
+    )
+
+
+# Example usage, checks the kernel against quantstats
+if __name__ == "__main__":
+    import quantstats as qs
+
+    rng = np.random.default_rng(7)
+    dates = pd.bdate_range("2015-01-01", periods=2500)
+    sample = pd.DataFrame(rng.normal(0.0004, 0.015, size=(len(dates), 3)), index=dates, columns=["A", "B", "C"])
+    sample.iloc[:400, 2] = np.nan  # listed later
+
+    kernel = performance_stats(sample)
+    for column in sample.columns:
+        series = sample[column].dropna()
+        for metric in PERFORMANCE_METRICS:
+            expected = float(getattr(qs.stats, metric)(series))
+            actual = kernel.at[column, metric]
+            status = "ok" if np.isclose(actual, expected, rtol=1e-9, atol=1e-12) else "MISMATCH"
+            print(f"{column} {metric:<14} {actual:+.10f} {expected:+.10f} {status}")
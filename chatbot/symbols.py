@@ -0,0 +1,476 @@
+import bisect
+import csv
+import difflib
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+from collections import namedtuple
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+# Constants
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+SYMBOL_LIST_PATH = os.environ.get("SYMBOL_LIST_PATH", os.path.join(DATA_DIR, "symbols.csv"))
+SYMBOL_INDEX_PATH = os.environ.get("SYMBOL_INDEX_PATH", os.path.join(DATA_DIR, "symbols.idx"))
+
+# The offset tables are read with memoryview.cast, so the index is stored in native byte order
+INDEX_MAGIC = b"QSYM1" + (b"L" if sys.byteorder == "little" else b"B") + b"\0\0"
+HEADER = struct.Struct("=8sII")  # magic, number of keys, number of records
+RECORD_SEP = "\x1f"
+
+PREFIX_LIMIT = 8
+# A prefix must cover whole tokens, and at least this share of them, "berkshire" but not "bank" of "bank of america"
+PREFIX_MIN_TOKEN_SHARE = 0.5
+FUZZY_PREFIX_CHARS = 3
+FUZZY_MIN_CHARS = 6
+FUZZY_MAX_CANDIDATES = 512
+# Applied to every token, "american water" is not a typo of "american tower"
+FUZZY_CUTOFF = 0.85
+
+# Trailing legal-form words dropped when normalizing names, "Apple Inc." and "apple" share a key
+_NAME_SUFFIXES = {
+    "inc", "incorporated", "corp", "corporation", "co", "company", "companies", "ltd", "limited",
+    "plc", "llc", "lp", "sa", "se", "ag", "nv", "holdings", "holding", "group", "the",
+}
+
+# Extraction: longest phrase tried per position, and words that are also company names or tickers
+MAX_PHRASE_TOKENS = 6
+NOT_TICKERS = {
+    "I", "A", "AI", "API", "ATH", "CAGR", "CEO", "CFO", "CPI", "CVAR", "DCF", "EBITDA", "EPS", "ETF", "EU", "EUR",
+    "FED", "FY", "GDP", "IPO", "NASDAQ", "NYSE", "OHLC", "PE", "Q1", "Q2", "Q3", "Q4", "ROA", "ROE", "ROI", "SEC",
+    "UK", "US", "USA", "USD", "VAR", "YTD",
+}
+# Ordinary words, never taken as a ticker or a name on their own ("is NOW a good time", "the low"), and
+# words that may follow a company name in a question, so the name ends before them ("apple stock price")
+COMMON_WORDS = {
+    "a", "about", "above", "after", "again", "against", "all", "also", "am", "an", "and", "any", "are", "as", "at",
+    "be", "because", "been", "before", "being", "below", "best", "better", "between", "big", "both", "but", "buy",
+    "by", "can", "could", "day", "did", "do", "does", "doing", "down", "during", "each", "ever", "few", "for",
+    "from", "get", "give", "go", "good", "had", "has", "have", "he", "her", "here", "high", "him", "his", "hold",
+    "how", "i", "if", "in", "into", "is", "it", "its", "just", "key", "last", "less", "like", "low", "make", "many",
+    "me", "more", "most", "much", "my", "new", "next", "no", "nor", "not", "now", "of", "off", "old", "on", "once",
+    "one", "only", "or", "other", "our", "out", "over", "own", "real", "same", "see", "sell", "she", "should",
+    "show", "so", "some", "such", "tell", "than", "that", "the", "their", "them", "then", "there", "these", "they",
+    "this", "those", "through", "time", "to", "today", "too", "true", "two", "under", "until", "up", "very", "vs",
+    "versus", "was", "way", "we", "week", "well", "were", "what", "when", "where", "which", "while", "who", "why",
+    "will", "with", "would", "year", "you", "your",
+    # Finance vocabulary
+    "analysis", "ask", "assets", "balance", "bid", "cap", "cash", "chart", "close", "compare", "compared",
+    "comparison", "data", "debt", "dividend", "dividends", "drawdown", "earnings", "equity", "financials",
+    "forecast", "fundamentals", "growth", "history", "income", "info", "information", "margin", "margins",
+    "market", "news", "open", "outlook", "performance", "price", "prices", "profit", "quote", "rate", "ratio",
+    "return", "returns", "revenue", "risk", "sales", "share", "shares", "stats", "stock", "stocks", "ticker",
+    "trading", "trend", "valuation", "value", "volatility", "volume", "yield",
+}
+# Only taken as company names when capitalized in the question
+AMBIGUOUS_NAMES = {
+    "arm", "block", "ford", "gold", "oracle", "shell", "silver", "square", "strategy", "target", "ups", "visa", "zoom",
+}
+
+# Capitalized words of finance vocabulary that do not name a company
+EPONYMOUS_TERMS = {
+    "alpha", "beta", "black", "calmar", "fama", "french", "jensen", "kelly", "markowitz", "omega", "scholes",
+    "sharpe", "sortino", "sterling", "treynor",
+}
+
+# Tokens glued to "&" are parts of names such as "S&P" or "AT&T", not tickers
+_TICKER_PATTERN = re.compile(r"(?<![\w&])[$^]?[A-Za-z][A-Za-z0-9]*(?:[.-][A-Za-z0-9]{1,3})?(?![\w.-]*\w|&)")
+_WORD_PATTERN = re.compile(r"[\w^]+(?:['’]\w+)?")
+
+SymbolRecord = namedtuple("SymbolRecord", ["symbol", "short_name", "long_name", "exchange"])
+
+
+def normalize_name(name) -> str:
+    """
+    Normalizes a company name or symbol into an index key.
+
+    Args:
+        name (str): The company name, alias or symbol.
+
+    Returns:
+        str: The lower-cased key without punctuation and legal-form suffixes.
+
+    Example: "The Walt Disney Company" -> "walt disney", "AT&T Inc." -> "at and t"
+    """
+    text = name.casefold().replace("&", " and ").replace("'", "").replace("’", "")
+    tokens = re.sub(r"[^\w^]+", " ", text).split()
+    while len(tokens) > 1 and tokens[-1] in _NAME_SUFFIXES:
+        tokens.pop()
+    if len(tokens) > 1 and tokens[0] == "the":
+        tokens.pop(0)
+    return " ".join(tokens)
+
+
+def build_index(source_path=SYMBOL_LIST_PATH, index_path=SYMBOL_INDEX_PATH):
+    """
+    Builds the on-disk symbol index from a bulk symbol list.
+
+    The source is a CSV file with the columns `symbol`, `short_name`, `long_name`, `exchange`
+    and `aliases` (separated by `|`). Rows listed first win when two rows share a key.
+
+    Args:
+        source_path (str): The symbol list CSV.
+        index_path (str): Where to write the index.
+
+    Returns:
+        int: The number of keys in the index.
+    """
+    records = []
+    keys = {}
+    with open(source_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            symbol = (row.get("symbol") or "").strip()
+            if not symbol:
+                continue
+            record_id = len(records)
+            records.append(RECORD_SEP.join([
+                symbol,
+                (row.get("short_name") or "").strip(),
+                (row.get("long_name") or "").strip(),
+                (row.get("exchange") or "").strip(),
+            ]).encode("utf-8"))
+            names = [symbol, row.get("short_name"), row.get("long_name")] + (row.get("aliases") or "").split("|")
+            for name in names:
+                key = normalize_name(name or "")
+                if key:
+                    keys.setdefault(key.encode("utf-8"), record_id)
+
+    sorted_keys = sorted(keys)
+    key_offsets = _offsets(sorted_keys)
+    record_offsets = _offsets(records)
+    key_records = memoryview(struct.pack(f"={len(sorted_keys)}I", *(keys[key] for key in sorted_keys)))
+
+    # Write next to the target and swap in atomically, other workers may be reading the old index
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(INDEX_MAGIC, len(sorted_keys), len(records)))
+        f.write(key_offsets)
+        f.write(key_records)
+        f.write(record_offsets)
+        f.write(b"".join(sorted_keys))
+        f.write(b"".join(records))
+    os.replace(tmp_path, index_path)
+
+    logging.info(f"Built symbol index {index_path} with {len(sorted_keys)} keys for {len(records)} symbols")
+    return len(sorted_keys)
+
+
+def _offsets(blobs) -> bytes:
+    offsets = [0]
+    for blob in blobs:
+        offsets.append(offsets[-1] + len(blob))
+    return struct.pack(f"={len(offsets)}I", *offsets)
+
+
+class SymbolIndex:
+    """
+    Read-only, memory-mapped company name -> ticker index.
+
+    Keys are sorted normalized names, aliases and symbols, so exact and prefix lookups
+    are a binary search over the mapped file. Worker processes share the pages through
+    the OS page cache.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, n_keys, n_records = HEADER.unpack_from(self._mm, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"Invalid symbol index {path}")
+
+        view = memoryview(self._mm)
+        pos = HEADER.size
+        self._key_offsets = view[pos:pos + 4 * (n_keys + 1)].cast("I")
+        pos += 4 * (n_keys + 1)
+        self._key_records = view[pos:pos + 4 * n_keys].cast("I")
+        pos += 4 * n_keys
+        self._record_offsets = view[pos:pos + 4 * (n_records + 1)].cast("I")
+        pos += 4 * (n_records + 1)
+        self._keys_base = pos
+        self._records_base = pos + self._key_offsets[n_keys]
+        self._n_keys = n_keys
+
+    def __len__(self):
+        return self._n_keys
+
+    def __getitem__(self, i) -> bytes:
+        # Lets bisect search the mapped key table directly
+        return self._mm[self._keys_base + self._key_offsets[i]:self._keys_base + self._key_offsets[i + 1]]
+
+    def _record(self, record_id) -> SymbolRecord:
+        start = self._records_base + self._record_offsets[record_id]
+        end = self._records_base + self._record_offsets[record_id + 1]
+        return SymbolRecord(*self._mm[start:end].decode("utf-8").split(RECORD_SEP))
+
+    def _record_at(self, i) -> SymbolRecord:
+        return self._record(self._key_records[i])
+
+    def get(self, name) -> Optional[SymbolRecord]:
+        """
+        Exact lookup of a normalized name, alias or symbol.
+        """
+        key = normalize_name(name).encode("utf-8")
+        i = bisect.bisect_left(self, key)
+        if key and i < self._n_keys and self[i] == key:
+            return self._record_at(i)
+        return None
+
+    def prefix(self, prefix, limit=PREFIX_LIMIT) -> List[Tuple[str, SymbolRecord]]:
+        """
+        Returns up to `limit` keys, in sorted order, starting with the normalized prefix.
+        """
+        key = normalize_name(prefix).encode("utf-8")
+        if not key:
+            return []
+        matches = []
+        i = bisect.bisect_left(self, key)
+        while i < self._n_keys and len(matches) < limit:
+            candidate = self[i]
+            if not candidate.startswith(key):
+                break
+            matches.append((candidate.decode("utf-8"), self._record_at(i)))
+            i += 1
+        return matches
+
+    def has_prefix(self, prefix) -> bool:
+        """
+        Whether any key starts with the already normalized `prefix`.
+        """
+        key = prefix.encode("utf-8")
+        i = bisect.bisect_left(self, key)
+        return i < self._n_keys and self[i].startswith(key)
+
+    def fuzzy(self, name, cutoff=FUZZY_CUTOFF) -> Optional[SymbolRecord]:
+        """
+        Closest key sharing the first characters of the normalized name, for typos such as "microsfot".
+        """
+        key = normalize_name(name)
+        if len(key) < FUZZY_MIN_CHARS:
+            return None
+        head = key[:FUZZY_PREFIX_CHARS].encode("utf-8")
+        start = bisect.bisect_left(self, head)
+        candidates = {}
+        i = start
+        while i < self._n_keys and i - start < FUZZY_MAX_CANDIDATES:
+            candidate = self[i]
+            if not candidate.startswith(head):
+                break
+            candidates[candidate.decode("utf-8")] = i
+            i += 1
+        tokens = key.split()
+        candidates = {
+            candidate: i for candidate, i in candidates.items()
+            if len(candidate.split()) == len(tokens) and all(
+                difflib.SequenceMatcher(None, token, other).ratio() >= cutoff
+                for token, other in zip(tokens, candidate.split())
+            )
+        }
+        best = difflib.get_close_matches(key, candidates.keys(), n=1, cutoff=cutoff)
+        return self._record_at(candidates[best[0]]) if best else None
+
+    def lookup(self, name) -> Optional[SymbolRecord]:
+        """
+        Resolves a company name: exact key, then an unambiguous prefix of whole tokens, then
+        a fuzzy match of every token.
+
+        Args:
+            name (str): The company name, alias or symbol.
+
+        Returns:
+            SymbolRecord: The matching record, or None when the name is not in the index.
+        """
+        record = self.get(name)
+        if record is not None:
+            return record
+
+        key = normalize_name(name)
+        matches = self.prefix(name)
+        if matches and len({match.symbol for _, match in matches}) == 1:
+            candidate = matches[0][0]
+            if candidate.startswith(key + " ") and len(key.split()) >= PREFIX_MIN_TOKEN_SHARE * len(candidate.split()):
+                return matches[0][1]
+
+        return self.fuzzy(name)
+
+
+def extract_symbols(text, index: SymbolIndex) -> List[str]:
+    """
+    Extracts the symbols of companies mentioned in a question without calling an LLM.
+
+    Spelled-out tickers ("MSFT", "$tsla", "^GSPC") are matched first. The remaining text
+    is scanned for the longest known company names, walking the sorted key table as a
+    trie: a phrase is only extended while some key starts with it. A name only counts
+    when it is not the start of a longer, unknown one.
+
+    Args:
+        text (str): The user question.
+        index (SymbolIndex): The symbol index.
+
+    Returns:
+        list: The unique symbols in order of appearance, empty when nothing confident was found.
+
+    Example: "show me MSFT and Apple beta" -> ["MSFT", "AAPL"]
+    """
+    found = []
+    segments = []
+    last = 0
+    for match in _TICKER_PATTERN.finditer(text):
+        token = match.group()
+        cashtag = token.startswith("$")
+        token = token.lstrip("$")
+        if not (cashtag or token.isupper()) or token.upper() in NOT_TICKERS:
+            continue
+        if not cashtag and token.casefold() in COMMON_WORDS:
+            continue
+        record = index.get(token)
+        if record is not None and record.symbol.upper() == token.upper().replace(".", "-"):
+            found.append((match.start(), record.symbol))
+            segments.append((last, match.start()))
+            last = match.end()
+    segments.append((last, len(text)))
+
+    # Company names are matched within the text between the tickers
+    for start, end in segments:
+        segment = text[start:end].replace("&", " and ")
+        matches = list(_WORD_PATTERN.finditer(segment))
+        # The text between each word and the next one
+        gaps = [segment[match.end():following.start()] for match, following in zip(matches, matches[1:])] + [""]
+        words = [(match.start() + start, match.group(), *_word_keys(match.group())) for match in matches]
+        i = 0
+        while i < len(words):
+            best = None
+            phrase = ""
+            for j in range(i, min(len(words), i + MAX_PHRASE_TOKENS)):
+                stem = words[j][3]
+                if stem is not None:
+                    # A possessive ends the name, "Apple's" is "apple" but "McDonald's" is a key of its own
+                    for key in (words[j][2], stem):
+                        record = index.get(f"{phrase} {key}" if phrase else key)
+                        if record is not None:
+                            best = (j, record)
+                            break
+                    break
+                phrase = f"{phrase} {words[j][2]}" if phrase else words[j][2]
+                if not index.has_prefix(phrase):
+                    break
+                record = index.get(phrase)
+                if record is not None:
+                    best = (j, record)
+
+            if best is not None:
+                name_end = _name_end(words, gaps, best[0], index)
+                if name_end is not None and _is_confident_name(words[i:best[0] + 1], best[1]):
+                    found.append((words[i][0], best[1].symbol))
+                    i = name_end + 1
+                    continue
+            i += 1
+
+    symbols = []
+    for _, symbol in sorted(found):
+        if symbol not in symbols:
+            symbols.append(symbol)
+    return symbols
+
+
+def has_proper_noun(text) -> bool:
+    """
+    Tells whether a question capitalizes a word that may name a company, one that does not
+    start a sentence and is neither an abbreviation of `NOT_TICKERS` nor a term such as "Sharpe".
+
+    Example: "and its Sharpe ratio?" -> False, "is it cheaper than Rivian?" -> True
+    """
+    for match in _WORD_PATTERN.finditer(text):
+        word = match.group()
+        # Single letters are initials or parts of "P/E", not names
+        if len(word) < 2 or not word[:1].isupper():
+            continue
+        before = text[:match.start()].rstrip()
+        if not before or before[-1] in ".!?":
+            continue
+        key, stem = _word_keys(word)
+        if word.upper() in NOT_TICKERS or (stem or key) in EPONYMOUS_TERMS:
+            continue
+        return True
+    return False
+
+
+def _word_keys(word) -> Tuple[str, Optional[str]]:
+    # The key of a word, and of its stem when it is a possessive
+    key = word.casefold().replace("’", "'")
+    stem = key[:-2] if key.endswith("'s") else None
+    return key.replace("'", ""), stem
+
+
+def _name_end(words, gaps, j, index: SymbolIndex) -> Optional[int]:
+    """
+    Position of the last word of a name matched up to `words[j]`, past its legal-form words
+    ("Apple Inc."), or None when the words that follow carry on a longer, unknown name, as in
+    "Apple Hospitality REIT".
+    """
+    while True:
+        if words[j][3] is not None or j + 1 == len(words) or gaps[j].strip():
+            # A possessive, the end of the text or punctuation ends the name
+            return j
+        following = words[j + 1]
+        if following[2] not in _NAME_SUFFIXES:
+            break
+        j += 1
+
+    key = following[3] or following[2]
+    if key in COMMON_WORDS or key in EPONYMOUS_TERMS or following[1].upper() in NOT_TICKERS:
+        return j
+    if words[j][1][:1].isupper() and not following[1][:1].isupper():
+        # "Apple stock", the case changes where the name ends
+        return j
+    # Another company right after, "Apple Microsoft"
+    return j if index.has_prefix(key) else None
+
+
+def _is_confident_name(words, record: SymbolRecord) -> bool:
+    original = " ".join(word[1] for word in words)
+    phrase = " ".join(word[3] or word[2] for word in words)
+    # Ordinary words and single letters that happen to be a ticker ("now", "low", "c") are not names
+    if phrase in COMMON_WORDS or len(phrase) < 2:
+        return False
+    if phrase in AMBIGUOUS_NAMES and not original[:1].isupper():
+        return False
+    return True
+
+
+@lru_cache(maxsize=1)
+def get_symbol_index() -> Optional[SymbolIndex]:
+    """
+    Loads the symbol index, building it first when it is missing or older than the symbol list.
+
+    Returns:
+        SymbolIndex: The index, or None when there is no symbol list to build it from.
+    """
+    try:
+        stale = (
+            not os.path.exists(SYMBOL_INDEX_PATH)
+            or (os.path.exists(SYMBOL_LIST_PATH) and os.path.getmtime(SYMBOL_LIST_PATH) > os.path.getmtime(SYMBOL_INDEX_PATH))
+        )
+        if stale:
+            if not os.path.exists(SYMBOL_LIST_PATH):
+                logging.warning(f"No symbol list at {SYMBOL_LIST_PATH}, names are resolved with Yahoo search only")
+                return None
+            build_index(SYMBOL_LIST_PATH, SYMBOL_INDEX_PATH)
+        return SymbolIndex(SYMBOL_INDEX_PATH)
+    except (OSError, ValueError, struct.error) as ex:
+        logging.error(f"Failed to load symbol index {SYMBOL_INDEX_PATH}: {ex}")
+        return None
+
+
+# Example usage
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "build":
+        build_index(*sys.argv[2:4])
+    else:
+        index = get_symbol_index()
+        for query in sys.argv[1:] or ["Microsoft Corp", "google", "microsfot", "berkshire", "AAPL"]:
+            print(query, "->", index.lookup(query))
+        print(extract_symbols("show me MSFT and Apple beta, then compare with the S&P 500", index))
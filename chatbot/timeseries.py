@@ -0,0 +1,146 @@
+import logging
+import os
+import time
+from typing import Optional
+from urllib.parse import quote
+
+import pandas as pd
+
+from chatbot.cache import CACHE_DIR, CACHE_TTLS
+
+# Constants
+HISTORY_DIR = os.path.join(CACHE_DIR, "history")
+HISTORY_STORE_BYTES = int(os.environ.get("MARKET_DATA_HISTORY_BYTES", 1024 * 1024 * 1024))
+# Relative change of an already stored adjusted close that means prices were re-adjusted (split, dividend)
+ADJUSTMENT_TOLERANCE = 1e-4
+
+
+class PriceHistoryStore:
+    """
+    Append-only on-disk store of price histories, one file per (symbol, interval).
+
+    Stored bars are kept across refreshes; a refresh only asks upstream for the bars
+    after the last stored timestamp. The file modification time records when the
+    series was last checked, so every worker on the host shares the refresh.
+
+    The files are kept apart from the disk cache tier, an incremental refresh needs the
+    stored bars even after their cache entry expired, and have their own size limit:
+    when a save grows the store past `max_bytes`, the series checked least recently are
+    deleted first and downloaded in full the next time they are asked for.
+    """
+
+    def __init__(self, directory=HISTORY_DIR, refresh_interval=CACHE_TTLS["history"], max_bytes=HISTORY_STORE_BYTES):
+        self.directory = directory
+        self.refresh_interval = refresh_interval
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, symbol, interval) -> str:
+        return os.path.join(self.directory, f"{quote(symbol, safe='')}.{interval}.pkl")
+
+    def load(self, symbol, interval="1d") -> Optional[pd.DataFrame]:
+        path = self._path(symbol, interval)
+        try:
+            return pd.read_pickle(path)
+        except FileNotFoundError:
+            return None
+        except Exception as ex:
+            logging.warning(f"Dropping unreadable history {path}: {ex}")
+            self.delete(symbol, interval)
+            return None
+
+    def is_fresh(self, symbol, interval="1d") -> bool:
+        try:
+            return time.time() - os.path.getmtime(self._path(symbol, interval)) < self.refresh_interval
+        except FileNotFoundError:
+            return False
+
+    def save(self, symbol, frame: pd.DataFrame, interval="1d"):
+        path = self._path(symbol, interval)
+        # Write next to the target and swap in atomically, other workers may be reading it
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        frame.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+        self._evict(path)
+
+    def _evict(self, keep_path):
+        files = list()
+        total = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".pkl"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        if total <= self.max_bytes:
+            return
+
+        # Oldest check first; readers of a removed file see it as missing and download it again
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path == keep_path:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        logging.info(f"Evicted price histories down to {total} bytes")
+
+    def touch(self, symbol, interval="1d"):
+        """
+        Marks the series as checked when upstream had no new bars.
+        """
+        try:
+            os.utime(self._path(symbol, interval))
+        except FileNotFoundError:
+            pass
+
+    def delete(self, symbol, interval="1d"):
+        try:
+            os.remove(self._path(symbol, interval))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def refresh_start(stored: pd.DataFrame) -> pd.Timestamp:
+        """
+        Where an incremental download should start: the second to last stored bar. It is
+        complete, so comparing it detects re-adjusted prices, and the last bar, which may
+        have been stored mid-session, is replaced.
+        """
+        return stored.index[-2] if len(stored) > 1 else stored.index[-1]
+
+    def append(self, symbol, stored: pd.DataFrame, update: pd.DataFrame, interval="1d") -> Optional[pd.DataFrame]:
+        """
+        Appends newly downloaded bars to a stored history.
+
+        Args:
+            symbol (str): The ticker symbol.
+            stored (DataFrame): The stored history.
+            update (DataFrame): Bars downloaded from `refresh_start(stored)` on.
+            interval (str): The bar interval.
+
+        Returns:
+            DataFrame: The combined history, or None when the overlapping bar no longer matches
+            and the whole history has to be downloaded again.
+        """
+        if update.empty:
+            self.touch(symbol, interval)
+            return stored
+
+        anchor = self.refresh_start(stored)
+        if anchor in update.index and "Close" in stored.columns:
+            before, after = stored.at[anchor, "Close"], update.at[anchor, "Close"]
+            if before and abs(after / before - 1) > ADJUSTMENT_TOLERANCE:
+                logging.info(f"History of {symbol} was re-adjusted, downloading it again")
+                return None
+
+        combined = pd.concat([stored[stored.index < update.index[0]], update])
+        self.save(symbol, combined, interval)
+        return combined
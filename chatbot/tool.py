@@ -1,9 +1,11 @@
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import pandas as pd
+
 from langchain_core.tools import tool
-import plotly.graph_objects as go
-from yfinance import Ticker
-import quantstats as qs
-from chatbot.data import YahooFinData
-from chatbot.services import get_ticker_from_query, to_plotly
+from chatbot.data import TickerInfo, YahooFinData, slice_period
+from chatbot.fields import COMPANY_INFO_FIELDS, FINANCIAL_INFO_FIELDS, TRADING_INFO_FIELDS, project_info
+from chatbot.services import get_ticker_from_query
 
 FAST_INFO = [
     'currency', 'dayHigh', 'dayLow', 'exchange', 'currentPrice', 'fiftyDayAverage', 'lastPrice', 'lastVolume', 'marketCap',
@@ -12,149 +14,160 @@ FAST_INFO = [
 ]
 
 
-def get_fast_info(yf_ticker: Ticker):
-    info = yf_ticker.info
+def get_fast_info(info: TickerInfo):
     fast_info = {
         key: info.get(key, "") for key in FAST_INFO
     }
     return fast_info
 
 
+def company_info(symbol, fields: Optional[List[str]] = None) -> dict:
+    return project_info(YahooFinData.get_info(symbol), COMPANY_INFO_FIELDS, fields)
+
+
+def trading_info(symbol, fields: Optional[List[str]] = None) -> dict:
+    return project_info(YahooFinData.get_info(symbol), TRADING_INFO_FIELDS, fields)
+
+
+def financial_info(symbol, fields: Optional[List[str]] = None) -> dict:
+    return project_info(YahooFinData.get_info(symbol), FINANCIAL_INFO_FIELDS, fields)
+
+
+def price_volume_history(symbol, period='2y', histories: Optional[Dict[str, pd.DataFrame]] = None) -> Optional[dict]:
+    from chatbot.charts import price_history_chart
+
+    if histories is None:
+        histories = YahooFinData.get_histories([symbol], period)
+    if symbol not in histories:
+        return None
+    summary_info = get_fast_info(YahooFinData.get_info(symbol))
+    hist = histories[symbol].reset_index()
+    title = f'{symbol} OHLC from {hist.Date.min().strftime("%Y-%m-%d")} to {hist.Date.max().strftime("%Y-%m-%d")}'
+    fig = price_history_chart(histories[symbol], title)
+    return {
+        "symbol": symbol,
+        "first_bar": hist.iloc[0].to_dict(),
+        "last_bar": hist.iloc[-1].to_dict(),
+        "summary": summary_info,
+        "fig": fig
+    }
+
+
+def stock_performance(symbol, stock_returns: Optional[Dict[str, pd.Series]] = None) -> Optional[dict]:
+    from chatbot.charts import performance_snapshot
+
+    if stock_returns is None:
+        stock_returns = YahooFinData.get_returns([symbol])
+    if symbol not in stock_returns:
+        return None
+    summary_info = get_fast_info(YahooFinData.get_info(symbol))
+    fig = performance_snapshot(stock_returns[symbol], title=f'{symbol} Performance')
+    return {
+        "symbol": symbol,
+        "summary": summary_info,
+        "fig": fig
+    }
+
+
+def _performance_stats_rows(stock_returns: Dict[str, pd.Series]) -> List[dict]:
+    from chatbot.stats import performance_stats, returns_matrix
+
+    if len(stock_returns) == 0:
+        return []
+    stats = performance_stats(returns_matrix(stock_returns))
+    return [{"symbol": symbol, **{metric: float(value) for metric, value in row.items()}} for symbol, row in stats.iterrows()]
+
+
+def _by_symbol(values: pd.Series) -> dict:
+    return {symbol: float(value) for symbol, value in values.items()}
+
+
+def performance_stats_by_symbol(symbols: List[str]) -> Dict[str, dict]:
+    return {row["symbol"]: row for row in _performance_stats_rows(YahooFinData.get_returns(symbols))}
+
+
+def stock_performance_stats(symbol, stats: Optional[Dict[str, dict]] = None) -> Optional[dict]:
+    if stats is None:
+        stats = performance_stats_by_symbol([symbol])
+    return stats.get(symbol)
+
+
+class TickerHandler(NamedTuple):
+    # `handle(symbol, **args, **preloaded)` with the tool arguments except `question`
+    handle: Callable
+    # `preload(symbols, **args)` loads the data of every ticker at once and returns the
+    # keyword arguments `handle` takes it through
+    preload: Optional[Callable] = None
+
+
+# Per-ticker handlers of the tools, used to stream results ticker by ticker, see `chatbot.executor.stream_tool_calls`
+TICKER_HANDLERS = {
+    "get_company_info": TickerHandler(company_info),
+    "get_stock_trading_info": TickerHandler(trading_info),
+    "get_financial_info": TickerHandler(financial_info),
+    "show_price_volume_history": TickerHandler(
+        price_volume_history,
+        lambda symbols, period='2y': {"histories": YahooFinData.get_histories(symbols, period)}
+    ),
+    "show_stock_performance": TickerHandler(
+        stock_performance,
+        lambda symbols: {"stock_returns": YahooFinData.get_returns(symbols)}
+    ),
+    "get_performance_stats": TickerHandler(
+        stock_performance_stats,
+        lambda symbols: {"stats": performance_stats_by_symbol(symbols)}
+    ),
+}
+
+
+def handle_tickers(tool_name, question, **args) -> List[dict]:
+    """
+    Runs the per-ticker handler of a tool for the tickers of a question, the same way
+    `chatbot.executor.stream_tool_calls` does, but all at once.
+
+    Args:
+        tool_name (str): The tool name, a key of `TICKER_HANDLERS`.
+        question (str): The user question.
+        **args: The other tool arguments.
+
+    Returns:
+        list: The non-empty results, in the order of the tickers.
+    """
+    handler = TICKER_HANDLERS[tool_name]
+    symbols = list(dict.fromkeys(ticker.symbol for ticker in get_ticker_from_query(question)))
+    preloaded = handler.preload(symbols, **args) if handler.preload is not None and symbols else dict()
+    results = [handler.handle(symbol, **args, **preloaded) for symbol in symbols]
+    return [result for result in results if result]
+
+
 @tool
-def get_company_info(question):
+def get_company_info(question, fields: Optional[List[str]] = None):
     """Return the company information when ask for it. The information include company name, sector, industry, address, phone, website, officers, and description, etc...
     Args:
         - question (str): The user question
+        - fields (list): Optional. Only the fields the question needs, e.g. ["sector", "industry"] for "which sector is it in". Leave empty to return all. The valid values are: exchange, address, city, state, zip, country, phone, website, industry, sector, longBusinessSummary, longName, shortName, fullTimeEmployees, companyOfficers
     """
-    tickers = get_ticker_from_query(question)
-    infos = list()
-    if len(tickers) > 0:
-        for ticker in tickers:
-            data = YahooFinData.get_instance(ticker.symbol)
-            info = data.info
-            infos.append({
-                "symbol": info.get("symbol", ""),
-                "exchange": info.get("exchange", ""),
-                "address": info.get("address1", ""),
-                "city": info.get("city", ""),
-                "state": info.get("state", ""),
-                "zip": info.get("zip", ""),
-                "country": info.get("country", ""),
-                "phone": info.get("phone", ""),
-                "website": info.get("website", ""),
-                "industry": info.get("industry", ""),
-                "sector": info.get("sector", ""),
-                "longBusinessSummary": info.get("longBusinessSummary", ""),
-                "longName": info.get("longName", ""),
-                "shortName": info.get("shortName", ""),
-                "fullTimeEmployees": info.get("fullTimeEmployees", ""),
-                "companyOfficers": info.get("companyOfficers", [])
-            })
-
-    return infos
+    return handle_tickers("get_company_info", question, fields=fields)
 
 
 @tool
-def get_stock_trading_info(question):
+def get_stock_trading_info(question, fields: Optional[List[str]] = None):
     """Return the stock trading information include current price, open, high, low, close, volume, bid, ask, market cap, beta, P/E, and EPS, etc...
     Args:
         - question (str): The user question
+        - fields (list): Optional. Only the fields the question needs, e.g. ["trailingPE", "forwardPE"] for "what is the P/E". Leave empty to return all. The valid values are: exchange, regularMarketPrice, regularMarketOpen, regularMarketPreviousClose, regularMarketVolume, regularMarketDayHigh, regularMarketDayLow, regularMarketDayRange, regularMarketBid, regularMarketAsk, marketCap, beta, trailingPE, forwardPE, eps, enterpriseValue, currency, pegRatio, priceToSalesTrailing12Months, priceToBook, enterpriseToRevenue, enterpriseToEbitda, priceHint, previousClose, open, dayLow, dayHigh, financialCurrency, currentPrice, volume, trailingPegRatio, bid, ask, bidSize, askSize, targetHighPrice, targetLowPrice, targetMeanPrice, targetMedianPrice, recommendationMean, recommendationKey
     """
-    tickers = get_ticker_from_query(question)
-    infos = list()
-    if len(tickers) > 0:
-        for ticker in tickers:
-            data = YahooFinData.get_instance(ticker.symbol)
-            info = data.info
-            infos.append({
-                "symbol": info.get("symbol", ""),
-                "exchange": info.get("exchange", ""),
-                "regularMarketPrice": info.get("regularMarketPrice", ""),
-                "regularMarketOpen": info.get("regularMarketOpen", ""),
-                "regularMarketPreviousClose": info.get("regularMarketPreviousClose", ""),
-                "regularMarketVolume": info.get("regularMarketVolume", ""),
-                "regularMarketDayHigh": info.get("regularMarketDayHigh", ""),
-                "regularMarketDayLow": info.get("regularMarketDayLow", ""),
-                "regularMarketDayRange": info.get("regularMarketDayRange", ""),
-                "regularMarketBid": info.get("regularMarketBid", ""),
-                "regularMarketAsk": info.get("regularMarketAsk", ""),
-                "marketCap": info.get("marketCap", ""),
-                "beta": info.get("beta", ""),
-                "trailingPE": info.get("trailingPE", ""),
-                "forwardPE": info.get("forwardPE", ""),
-                "eps": info.get("eps", ""),
-                "enterpriseValue": info.get("enterpriseValue", 0),
-                "currency": info.get("currency", ""),
-                "pegRatio": info.get("pegRatio", 0),
-                "priceToSalesTrailing12Months": info.get("priceToSalesTrailing12Months", 0),
-                "priceToBook": info.get("priceToBook", 0),
-                "enterpriseToRevenue": info.get("enterpriseToRevenue", 0),
-                "enterpriseToEbitda": info.get("enterpriseToEbitda", 0),
-                "priceHint": info.get("priceHint", 0),
-                "previousClose": info.get("previousClose", 0),
-                "open": info.get("open", 0),
-                "dayLow": info.get("dayLow", 0),
-                "dayHigh": info.get("dayHigh", 0),
-                "financialCurrency": info.get("financialCurrency", ""),
-                "currentPrice": info.get("currentPrice", 0),
-                "volume": info.get("volume", 0),
-                "trailingPegRatio": info.get("trailingPegRatio", 0),
-                "bid": info.get("bid", 0),
-                "ask": info.get("ask", 0),
-                "bidSize": info.get("bidSize", 0),
-                "askSize": info.get("askSize", 0),
-                "targetHighPrice": info.get("targetHighPrice", 0),
-                "targetLowPrice": info.get("targetLowPrice", 0),
-                "targetMeanPrice": info.get("targetMeanPrice", 0),
-                "targetMedianPrice": info.get("targetMedianPrice", 0),
-                "recommendationMean": info.get("recommendationMean", 0),
-                "recommendationKey": info.get("recommendationKey", ""),
-
-            })
-
-    return infos
+    return handle_tickers("get_stock_trading_info", question, fields=fields)
 
 
 @tool
-def get_financial_info(question):
+def get_financial_info(question, fields: Optional[List[str]] = None):
     """Return the financial information include balance sheet, income statement, debt, revenue, cash flow, and financial ratios, etc...
     Args:
         - question (str): The user question
+        - fields (list): Optional. Only the fields the question needs, e.g. ["totalDebt", "debtToEquity"] for "how much debt". Leave empty to return all. The valid values are: totalCash, totalCashPerShare, ebitda, totalDebt, quickRatio, currentRatio, totalRevenue, debtToEquity, revenuePerShare, returnOnAssets, returnOnEquity, freeCashflow, operatingCashflow, earningsQuarterlyGrowth, netIncomeToCommon, trailingEps, forwardEps, earningsGrowth, revenueGrowth, grossMargins, ebitdaMargins, operatingMargins, financialCurrency
     """
-    tickers = get_ticker_from_query(question)
-    infos = list()
-    if len(tickers) > 0:
-        for ticker in tickers:
-            data = YahooFinData.get_instance(ticker.symbol)
-            info = data.info
-            infos.append({
-                "symbol": info.get("symbol"),
-                "totalCash": info.get("totalCash", 0),
-                "totalCashPerShare": info.get("totalCashPerShare", 0),
-                "ebitda": info.get("ebitda", 0),
-                "totalDebt": info.get("totalDebt", 0),
-                "quickRatio": info.get("quickRatio", 0),
-                "currentRatio": info.get("currentRatio", 0),
-                "totalRevenue": info.get("totalRevenue", 0),
-                "debtToEquity": info.get("debtToEquity", 0),
-                "revenuePerShare": info.get("revenuePerShare", 0),
-                "returnOnAssets": info.get("returnOnAssets", 0),
-                "returnOnEquity": info.get("returnOnEquity", 0),
-                "freeCashflow": info.get("freeCashflow", 0),
-                "operatingCashflow": info.get("operatingCashflow", 0),
-                "earningsQuarterlyGrowth": info.get("earningsQuarterlyGrowth", 0),
-                "netIncomeToCommon": info.get("netIncomeToCommon", 0),
-                "trailingEps": info.get("trailingEps", 0),
-                "forwardEps": info.get("forwardEps", 0),
-                "earningsGrowth": info.get("earningsGrowth", 0),
-                "revenueGrowth": info.get("revenueGrowth", 0),
-                "grossMargins": info.get("grossMargins", 0),
-                "ebitdaMargins": info.get("ebitdaMargins", 0),
-                "operatingMargins": info.get("operatingMargins", 0),
-                "financialCurrency": info.get("financialCurrency", "")
-            })
-
-    return infos
+    return handle_tickers("get_financial_info", question, fields=fields)
 
 
 @tool
@@ -164,28 +177,7 @@ def show_price_volume_history(question, period='2y'):
         - question (str): The user question
         - period (str): The period of the price history (default is 2y). The valid values are: 1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max
     """
-    tickers = get_ticker_from_query(question)
-    infos = list()
-    for ticker in tickers:
-        symbol = ticker.symbol
-        data = YahooFinData.get_instance(symbol)
-        summary_info = get_fast_info(data)
-        hist = data.history(period=period).reset_index()
-        fig = go.Figure(
-            data=go.Ohlc(x=hist['Date'],
-                open=hist['Open'],
-                high=hist['High'],
-                low=hist['Low'],
-                close=hist['Close'])
-        )
-        title = f'{symbol} OHLC from {hist.Date.min().strftime("%Y-%m-%d")} to {hist.Date.max().strftime("%Y-%m-%d")}'
-        fig.update_layout(title=title)
-        infos.append({
-            "symbol": symbol,
-            "summary": f"{hist.iloc[0].__str__()}\n-----\n{hist.iloc[-1].__str__()}\n-----\nInfo: {summary_info}",
-            "fig": fig
-        })
-    return infos
+    return handle_tickers("show_price_volume_history", question, period=period)
 
 
 @tool
@@ -194,23 +186,7 @@ def show_stock_performance(question):
     Args:
         - question (str): The user question
     """
-    tickers = get_ticker_from_query(question)
-    infos = list()
-    for ticker in tickers:
-        symbol = ticker.symbol
-        data = YahooFinData.get_instance(symbol)
-        returns = YahooFinData.download_stock_returns(symbol)
-        summary_info = get_fast_info(data)
-        fig = qs.plots.snapshot(returns, show=False)
-        title = f'{symbol} Performance'
-        fig.title = title
-        fig = to_plotly(fig)
-        infos.append({
-            "symbol": symbol,
-            "summary": f"{summary_info}",
-            "fig": fig
-        })
-    return infos
+    return handle_tickers("show_stock_performance", question)
 
 
 @tool
@@ -219,26 +195,91 @@ def get_performance_stats(question):
     Args:
         - question (str): The user question
     """
-    tickers = get_ticker_from_query(question)
-    infos = list()
-    if len(tickers) > 0:
-        for ticker in tickers:
-            returns = YahooFinData.download_stock_returns(ticker.symbol)
-            infos.append({
-                "symbol": ticker.symbol,
-                "cagr": qs.stats.cagr(returns),
-                "sharpe": qs.stats.sharpe(returns),
-                "max_drawdown": qs.stats.max_drawdown(returns),
-                "sortino": qs.stats.sortino(returns),
-                "avg_win": qs.stats.avg_win(returns),
-                "avg_loss": qs.stats.avg_loss(returns),
-                "volatility": qs.stats.volatility(returns),
-                "calmar": qs.stats.calmar(returns),
-                "value_at_risk": qs.stats.value_at_risk(returns),
-                "cvar": qs.stats.cvar(returns)
-            })
-
-    return infos
+    return handle_tickers("get_performance_stats", question)
+
+
+@tool
+def compare_assets(question, benchmark='SPY', period='5y'):
+    """Compare several stocks with each other and with a benchmark: correlation, covariance, beta, total and relative return, and rolling sharpe, in one chart. Use it for questions comparing two or more stocks.
+    Args:
+        - question (str): The user question
+        - benchmark (str): The benchmark ticker of the beta and relative return (default is SPY)
+        - period (str): The period of the comparison (default is 5y). The valid values are: 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max
+    """
+    from chatbot.charts import comparison_chart
+    from chatbot.stats import compare_returns, returns_matrix
+
+    symbols = [ticker.symbol for ticker in get_ticker_from_query(question)]
+    stock_returns = YahooFinData.get_returns(list(dict.fromkeys(symbols + [benchmark])))
+    if benchmark not in stock_returns or len(stock_returns) < 2:
+        return []
+    comparison = compare_returns(slice_period(returns_matrix(stock_returns), period), benchmark)
+    if comparison.cumulative.empty:
+        return []
+
+    start, end = comparison.cumulative.index[0], comparison.cumulative.index[-1]
+    return [{
+        "symbols": list(comparison.cumulative.columns),
+        "benchmark": benchmark,
+        "start": start.strftime("%Y-%m-%d"),
+        "end": end.strftime("%Y-%m-%d"),
+        "correlation": {symbol: _by_symbol(row) for symbol, row in comparison.correlation.iterrows()},
+        "annualized_covariance": {symbol: _by_symbol(row) for symbol, row in comparison.covariance.iterrows()},
+        "beta": _by_symbol(comparison.beta),
+        "total_return": _by_symbol(comparison.total_return),
+        "relative_return": _by_symbol(comparison.relative_return),
+        "latest_rolling_sharpe": _by_symbol(comparison.rolling_sharpe.iloc[-1]) if len(comparison.rolling_sharpe) else {},
+        "fig": comparison_chart(
+            comparison.cumulative, comparison.rolling_sharpe, benchmark,
+            title=f'Comparison with {benchmark} from {start.strftime("%Y-%m-%d")} to {end.strftime("%Y-%m-%d")}'
+        ),
+    }]
+
+
+@tool
+def get_portfolio_performance(question, weights: Optional[Dict[str, float]] = None, rebalance='monthly', start: Optional[str] = None):
+    """Backtest a portfolio of several stocks or ETFs held at fixed weights, e.g. "60% SPY 40% TLT, monthly rebalance, since 2010". Return cagr, sharpe, max_drawdown, sortino, avg_win, avg_loss, volatility, calmar, value_at_risk, cvar and turnover, with an equity and drawdown chart.
+    Args:
+        - question (str): The user question
+        - weights (dict): Optional. The weight of each ticker symbol, e.g. {"SPY": 0.6, "TLT": 0.4}. Leave empty for equal weights of the stocks in the question
+        - rebalance (str): How often the portfolio is traded back to its weights (default is monthly). The valid values are: none, daily, weekly, monthly, quarterly, yearly
+        - start (str): Optional. The start date of the backtest, e.g. 2010-01-01. Leave empty to start when every ticker has data
+    """
+    from chatbot.charts import portfolio_chart
+    from chatbot.stats import backtest_portfolio, performance_stats, returns_matrix
+
+    if weights:
+        weights = pd.Series({symbol.strip().upper(): float(weight) for symbol, weight in weights.items()})
+    else:
+        symbols = list(dict.fromkeys(ticker.symbol for ticker in get_ticker_from_query(question)))
+        weights = pd.Series(1.0, index=symbols)
+    stock_returns = YahooFinData.get_returns(list(weights.index))
+    weights = weights[[symbol in stock_returns for symbol in weights.index]]
+    if len(weights) == 0 or weights.sum() <= 0:
+        return []
+
+    matrix = returns_matrix(stock_returns)
+    if start:
+        matrix = matrix[matrix.index >= pd.Timestamp(start)]
+    backtest = backtest_portfolio(matrix, weights, rebalance)
+    if backtest.returns.empty:
+        return []
+
+    stats = performance_stats(backtest.returns.to_frame())
+    first, last = backtest.returns.index[0].strftime("%Y-%m-%d"), backtest.returns.index[-1].strftime("%Y-%m-%d")
+    weights = weights / weights.sum()
+    name = ", ".join(f"{weight:.0%} {symbol}" for symbol, weight in weights.items())
+    return [{
+        "portfolio": name,
+        "weights": _by_symbol(weights),
+        "rebalance": rebalance,
+        "start": first,
+        "end": last,
+        **_by_symbol(stats.iloc[0]),
+        "turnover": backtest.turnover,
+        "rebalances": backtest.rebalances,
+        "fig": portfolio_chart(backtest.returns, title=f"{name} rebalanced {rebalance} from {first} to {last}"),
+    }]
 
 
 @tool